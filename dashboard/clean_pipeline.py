@@ -3,9 +3,10 @@ import os
 import time
 import json
 import psycopg2
+from psycopg2.extras import execute_values
 import logging
 from datetime import datetime
-import random
+import numpy as np
 
 # Set up logging without Unicode characters
 os.makedirs('../logs', exist_ok=True)
@@ -21,7 +22,10 @@ logger = logging.getLogger(__name__)
 
 # Add ml-models to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+from pipeline_base import generate_sensor_batch
 
 class CleanPipeline:
     def __init__(self):
@@ -31,10 +35,15 @@ class CleanPipeline:
         self.db_connected = False
         self.conn = None
         self.cursor = None
+        # Per-batch metric rows, written by flush_metrics()
+        self._metric_rows = []
         
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
         
         # Setup connections
         self.setup_database()
@@ -47,6 +56,8 @@ class CleanPipeline:
             'errors': 0,
             'start_time': datetime.now()
         }
+        # Elapsed time for the status row, without a wall-clock read
+        self._start_mono = time.monotonic()
         
     def load_model(self):
         try:
@@ -64,24 +75,12 @@ class CleanPipeline:
         logger.info("SUCCESS: New model trained and saved")
     
     def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        """Training set as an (N, 2) temperature/humidity array for detector.train()"""
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples))
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples))
+        return np.column_stack((temperature, humidity)).round(2)
     
     def setup_database(self):
         logger.info("Setting up PostgreSQL connection...")
@@ -152,6 +151,8 @@ class CleanPipeline:
             for table_sql in tables:
                 self.cursor.execute(table_sql)
             
+            # DEFAULT/daily partitions and retention, if the tables are partitioned
+            maintain_partitions(self.conn)
             self.conn.commit()
             self.db_connected = True
             logger.info("SUCCESS: PostgreSQL connected and all tables created")
@@ -176,36 +177,28 @@ class CleanPipeline:
             logger.error(f"Failed to log system event: {e}")
     
     def log_metric(self, metric_name, value, sensor_id=None, tags=None):
-        """Log metrics for Grafana dashboards"""
+        """Buffer a metric for Grafana dashboards, written by flush_metrics()"""
         if not self.db_connected:
             return
             
+        self._metric_rows.append((metric_name, value, sensor_id, str(tags) if tags else None))
+    
+    def flush_metrics(self):
+        """Write all buffered metrics as one multi-row INSERT"""
+        if not self._metric_rows:
+            return
+            
         try:
-            self.cursor.execute("""
+            execute_values(self.cursor, """
                 INSERT INTO pipeline_metrics (metric_name, metric_value, sensor_id, tags)
-                VALUES (%s, %s, %s, %s)
-            """, (metric_name, value, sensor_id, str(tags) if tags else None))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Failed to log metric: {e}")
+                VALUES %s
+            """, self._metric_rows, page_size=500)
+        finally:
+            self._metric_rows.clear()
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.15  # 15% anomaly rate
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
-        }
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, 0.15, now)  # 15% anomaly rate
     
     def save_to_database(self, reading, prediction):
         if not self.db_connected:
@@ -249,7 +242,7 @@ class CleanPipeline:
             self.stats['errors'] += 1
             return False
     
-    def save_to_local_files(self, reading, prediction):
+    def save_to_local_files(self, reading, prediction, now):
         """Save data to local files as data lake simulation"""
         try:
             # Create directories
@@ -257,6 +250,8 @@ class CleanPipeline:
             os.makedirs('../data/silver', exist_ok=True)
             os.makedirs('../data/gold', exist_ok=True)
             
+            hour_suffix = now.strftime('%Y%m%d_%H')
+            
             data = {
                 'sensor_id': reading['sensor_id'],
                 'timestamp': reading['timestamp'].isoformat(),
@@ -267,19 +262,19 @@ class CleanPipeline:
             }
             
             # Save to bronze (all data)
-            bronze_file = f"../data/bronze/sensor_data_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
+            bronze_file = f"../data/bronze/sensor_data_{hour_suffix}.jsonl"
             with open(bronze_file, 'a', encoding='utf-8') as f:
                 f.write(json.dumps(data) + '\n')
             
             # Save to appropriate layer
             if prediction == -1:
                 # Anomaly - save to gold
-                gold_file = f"../data/gold/anomalies_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
+                gold_file = f"../data/gold/anomalies_{hour_suffix}.jsonl"
                 with open(gold_file, 'a', encoding='utf-8') as f:
                     f.write(json.dumps(data) + '\n')
             else:
                 # Normal - save to silver
-                silver_file = f"../data/silver/normal_data_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
+                silver_file = f"../data/silver/normal_data_{hour_suffix}.jsonl"
                 with open(silver_file, 'a', encoding='utf-8') as f:
                     f.write(json.dumps(data) + '\n')
             
@@ -290,12 +285,14 @@ class CleanPipeline:
             return False
     
     def update_pipeline_status(self):
-        """Update overall pipeline status for monitoring"""
+        """Write the batch's metrics and the status row in one transaction"""
         if not self.db_connected:
             return
             
         try:
-            uptime = (datetime.now() - self.stats['start_time']).total_seconds()
+            self.flush_metrics()
+            
+            uptime = time.monotonic() - self._start_mono
             
             self.cursor.execute("""
                 INSERT INTO pipeline_status 
@@ -315,10 +312,11 @@ class CleanPipeline:
             
         except Exception as e:
             logger.error(f"Status update failed: {e}")
+            self.conn.rollback()
     
-    def print_dashboard(self):
+    def print_dashboard(self, now):
         """Print console dashboard"""
-        uptime = datetime.now() - self.stats['start_time']
+        uptime = now - self.stats['start_time']
         anomaly_rate = (self.stats['anomalies_detected'] / self.stats['total_readings'] * 100) if self.stats['total_readings'] > 0 else 0
         
         print("\n" + "="*70)
@@ -345,23 +343,32 @@ class CleanPipeline:
             return
         
         batch_count = 0
+        # Batches start on fixed 8s beats; I/O time doesn't push the schedule back
+        next_tick = time.monotonic()
         
         try:
             while True:
                 batch_count += 1
-                batch_start_time = time.time()
+                batch_start_time = time.monotonic()
                 batch_anomalies = 0
                 
                 logger.info(f"Processing Batch {batch_count}")
                 
+                # One timestamp for the whole batch
+                iter_now = datetime.now()
+                
                 # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    prediction = self.detector.predict([reading])[0]
+                features, readings = self.generate_batch(iter_now)
+                
+                # ML prediction for the whole batch in one call
+                predictions = self.detector.predict_ndarray(features).tolist()
+                
+                for reading, prediction in zip(readings, predictions):
+                    sensor_id = reading['sensor_id']
                     
                     # Save to database and local files
                     db_success = self.save_to_database(reading, prediction)
-                    file_success = self.save_to_local_files(reading, prediction)
+                    file_success = self.save_to_local_files(reading, prediction, iter_now)
                     
                     self.stats['total_readings'] += 1
                     
@@ -379,16 +386,22 @@ class CleanPipeline:
                         logger.info(f"Normal: {sensor_id} - T:{reading['temperature']}C H:{reading['humidity']}%")
                 
                 # Log batch metrics
-                batch_time = (time.time() - batch_start_time) * 1000
+                batch_time = (time.monotonic() - batch_start_time) * 1000
                 self.log_metric('batch_processing_time_ms', batch_time)
                 self.log_metric('batch_size', len(self.sensors))
                 
-                # Update status and show dashboard
+                # Metrics and status row go out with one commit
                 self.update_pipeline_status()
-                self.print_dashboard()
+                self.print_dashboard(iter_now)
                 
-                logger.info("Waiting 8 seconds before next batch...")
-                time.sleep(8)  # 8 second intervals
+                next_tick += 8.0  # 8 second intervals
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    logger.info(f"Waiting {sleep_for:.1f} seconds before next batch...")
+                    time.sleep(sleep_for)
+                else:
+                    logger.warning(f"Batch {batch_count} overran its 8s budget by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             logger.info("Pipeline stopped by user")
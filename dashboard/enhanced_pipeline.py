@@ -1,20 +1,43 @@
 import sys
 import os
+import io
 import time
 import json
 import psycopg2
+from psycopg2.extras import execute_values
 from datetime import datetime
-import random
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Add ml-models to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+from pipeline_base import generate_sensor_batch
+
+def to_json_line(data):
+    """Serialize a record as one newline-terminated JSON line (bytes)"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data) + '\n').encode()
 
 class EnhancedPipeline:
     def __init__(self):
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
+        # Open append handles keyed by (layer, hour_suffix)
+        self._fh_cache = {}
+        for layer in ('bronze', 'silver', 'gold'):
+            os.makedirs(f'../data/{layer}', exist_ok=True)
         self.setup_database()
         
     def load_model(self):
@@ -32,33 +55,41 @@ class EnhancedPipeline:
         print("SUCCESS: Model trained and saved")
     
     def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples)).round(2)
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples)).round(2)
+        sensor_numbers = rng.integers(1, 6, num_samples)
+        timestamp = datetime.now().isoformat()
+        
+        return [
+            {
+                'sensor_id': f'sensor_{sensor_number:03d}',
+                'timestamp': timestamp,
+                'temperature': temp,
+                'humidity': hum,
+                'is_anomaly': anomaly
+            }
+            for sensor_number, temp, hum, anomaly in zip(
+                sensor_numbers.tolist(), temperature.tolist(), humidity.tolist(), is_anomaly.tolist()
+            )
+        ]
     
     def setup_database(self):
+        # Per-batch COPY buffers, flushed by flush_to_database()
+        self._readings_buf = io.StringIO()
+        self._alerts_buf = io.StringIO()
+        
         try:
             self.conn = psycopg2.connect(
                 host="localhost",
                 database="iot_analytics",
                 user="postgres",
                 password="postgres",
-                port="5432"
+                port="5432",
+                # Metric and reading commits skip the WAL fsync wait; a
+                # crash can only lose the last few hundred ms of them
+                options="-c synchronous_commit=off"
             )
             self.cursor = self.conn.cursor()
             
@@ -98,6 +129,8 @@ class EnhancedPipeline:
                 )
             """)
             
+            # DEFAULT/daily partitions and retention, if the tables are partitioned
+            maintain_partitions(self.conn)
             self.conn.commit()
             print("SUCCESS: Database setup complete")
             
@@ -105,120 +138,127 @@ class EnhancedPipeline:
             print(f"Database connection failed: {e}")
             self.conn = None
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.12  # 12% anomaly rate for more action
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
-        }
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, 0.12, now)  # 12% anomaly rate for more action
     
     def save_to_database(self, reading, prediction):
+        """Buffer a reading (and alert) for the next COPY flush"""
         if not self.conn:
             return
             
+        self._readings_buf.write(
+            f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+            f"{reading['humidity']}\t{reading['actual_anomaly']}\t{prediction}\n"
+        )
+        
+        # Buffer anomaly alert if detected
+        if prediction == -1:
+            self._alerts_buf.write(
+                f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+                f"{reading['humidity']}\tML_DETECTED\n"
+            )
+    
+    def _copy_buffer(self, buf, table):
+        """COPY a tab-separated buffer into table"""
+        if buf.tell() == 0:
+            return
+        buf.seek(0)
+        self.cursor.copy_expert(f"COPY {table} FROM STDIN", buf)
+    
+    def flush_to_database(self):
+        """Write all buffered rows; committed by commit_batch()"""
         try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
-            
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
+            if self._alerts_buf.tell():
+                # Anomaly alerts must be durable - wait for the fsync on this batch
+                self.cursor.execute("SET LOCAL synchronous_commit = on")
+            self._copy_buffer(
+                self._readings_buf,
+                "sensor_readings (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)"
+            )
+            self._copy_buffer(
+                self._alerts_buf,
+                "anomaly_alerts (sensor_id, timestamp, temperature, humidity, alert_type)"
+            )
+        finally:
+            for buf in (self._readings_buf, self._alerts_buf):
+                buf.seek(0)
+                buf.truncate(0)
+    
+    def commit_batch(self, total_readings, anomaly_count):
+        """Persist the batch's rows and dashboard metrics in one transaction"""
+        if not self.conn:
+            return
             
+        try:
+            self.flush_to_database()
+            self.update_dashboard_metrics(total_readings, anomaly_count)
             self.conn.commit()
             
         except Exception as e:
             print(f"Database save error: {e}")
+            self.conn.rollback()
     
-    def save_to_file(self, reading, prediction):
-        """Save data to files for MinIO simulation"""
+    def _layer_file(self, layer, prefix, hour_suffix):
+        """Return the append handle for a layer's current hourly file"""
+        handle = self._fh_cache.get((layer, hour_suffix))
+        if handle is None:
+            # Hour rolled over - close the previous file for this layer
+            for key in [k for k in self._fh_cache if k[0] == layer]:
+                self._fh_cache.pop(key).close()
+            handle = open(f"../data/{layer}/{prefix}_{hour_suffix}.jsonl", 'ab', buffering=1 << 20)
+            self._fh_cache[(layer, hour_suffix)] = handle
+        return handle
+    
+    def save_to_file(self, reading, prediction, hour_suffix):
+        """Save data to files for MinIO simulation (hour_suffix: YYYYmmdd_HH)"""
         try:
-            # Create directories if they don't exist
-            os.makedirs('../data/bronze', exist_ok=True)
-            os.makedirs('../data/silver', exist_ok=True)
-            os.makedirs('../data/gold', exist_ok=True)
+            data = {
+                'sensor_id': reading['sensor_id'],
+                'timestamp': reading['timestamp'].isoformat(),
+                'temperature': reading['temperature'],
+                'humidity': reading['humidity'],
+                'ml_prediction': prediction
+            }
+            line = to_json_line(data)
             
             # Save to bronze (raw data)
-            bronze_file = f"../data/bronze/sensor_data_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
-            with open(bronze_file, 'a') as f:
-                data = {
-                    'sensor_id': reading['sensor_id'],
-                    'timestamp': reading['timestamp'].isoformat(),
-                    'temperature': reading['temperature'],
-                    'humidity': reading['humidity'],
-                    'ml_prediction': prediction
-                }
-                f.write(json.dumps(data) + '\n')
+            self._layer_file('bronze', 'sensor_data', hour_suffix).write(line)
             
             # Save to appropriate layer based on prediction
             if prediction == -1:
                 # Anomaly - save to gold
-                gold_file = f"../data/gold/anomalies_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
-                with open(gold_file, 'a') as f:
-                    f.write(json.dumps(data) + '\n')
+                self._layer_file('gold', 'anomalies', hour_suffix).write(line)
             else:
                 # Normal - save to silver
-                silver_file = f"../data/silver/normal_data_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
-                with open(silver_file, 'a') as f:
-                    f.write(json.dumps(data) + '\n')
+                self._layer_file('silver', 'normal_data', hour_suffix).write(line)
                     
         except Exception as e:
             print(f"File save error: {e}")
     
+    def flush_files(self):
+        """Flush buffered file writes once per batch"""
+        for handle in self._fh_cache.values():
+            handle.flush()
+    
+    def close_files(self):
+        for handle in self._fh_cache.values():
+            handle.close()
+        self._fh_cache.clear()
+    
     def update_dashboard_metrics(self, total_readings, anomaly_count):
         """Update metrics for dashboard"""
-        if not self.conn:
-            return
-            
-        try:
-            metrics = [
-                ('total_readings', total_readings),
-                ('anomaly_count', anomaly_count),
-                ('anomaly_rate', (anomaly_count / total_readings * 100) if total_readings > 0 else 0),
-                ('normal_count', total_readings - anomaly_count)
-            ]
-            
-            for metric_name, value in metrics:
-                self.cursor.execute("""
-                    INSERT INTO dashboard_metrics (metric_name, metric_value)
-                    VALUES (%s, %s)
-                """, (metric_name, value))
-            
-            self.conn.commit()
-            
-        except Exception as e:
-            print(f"Metrics update error: {e}")
+        metrics = [
+            ('total_readings', total_readings),
+            ('anomaly_count', anomaly_count),
+            ('anomaly_rate', (anomaly_count / total_readings * 100) if total_readings > 0 else 0),
+            ('normal_count', total_readings - anomaly_count)
+        ]
+        
+        execute_values(self.cursor, """
+            INSERT INTO dashboard_metrics (metric_name, metric_value)
+            VALUES %s
+        """, metrics)
     
     def run_realtime_pipeline(self):
         print("Starting Enhanced Real-Time IoT Pipeline")
@@ -229,6 +269,7 @@ class EnhancedPipeline:
         reading_count = 0
         anomaly_count = 0
         batch_count = 0
+        next_tick = time.monotonic()
         
         try:
             while True:
@@ -237,16 +278,20 @@ class EnhancedPipeline:
                 
                 print(f"\n--- Batch {batch_count} ---")
                 
+                # File names only change hourly, so format them once per batch
+                batch_now = datetime.now()
+                hour_suffix = batch_now.strftime('%Y%m%d_%H')
+                
                 # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    
-                    # ML prediction
-                    prediction = self.detector.predict([reading])[0]
-                    
+                features, readings = self.generate_batch(batch_now)
+                
+                # ML prediction for the whole batch in one call
+                predictions = self.detector.predict_ndarray(features).tolist()
+                
+                for reading, prediction in zip(readings, predictions):
                     # Save to database and files
                     self.save_to_database(reading, prediction)
-                    self.save_to_file(reading, prediction)
+                    self.save_to_file(reading, prediction, hour_suffix)
                     
                     reading_count += 1
                     
@@ -257,13 +302,22 @@ class EnhancedPipeline:
                     else:
                         print(f"  Normal:  {reading['sensor_id']} - T:{reading['temperature']}°C H:{reading['humidity']}%")
                 
-                # Update dashboard metrics
-                self.update_dashboard_metrics(reading_count, anomaly_count)
+                # One COPY per table plus dashboard metrics, one commit
+                self.commit_batch(reading_count, anomaly_count)
+                self.flush_files()
                 
                 print(f"Batch Summary: {5 - batch_anomalies} normal, {batch_anomalies} anomalies")
                 print(f"Total: {reading_count} readings, {anomaly_count} anomalies ({anomaly_count/reading_count*100:.1f}%)")
                 
-                time.sleep(5)  # 5 second intervals for better visualization
+                # 5 second cadence measured from batch start, so processing
+                # time does not push every following batch later
+                next_tick += 5.0
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                else:
+                    print(f"WARNING: Batch {batch_count} overran its 5s budget by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             print(f"\nPipeline stopped. Final stats:")
@@ -271,6 +325,7 @@ class EnhancedPipeline:
             print(f"Anomalies detected: {anomaly_count}")
             print(f"Anomaly rate: {anomaly_count/reading_count*100:.1f}%")
         finally:
+            self.close_files()
             if self.conn:
                 self.conn.close()
 
@@ -1,28 +1,59 @@
 import sys
 import os
+import io
+import gzip
 import time
 import json
 import psycopg2
+from psycopg2.extras import execute_values, Json
 import boto3
 import logging
+import logging.handlers
+import queue
+import atexit
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-import random
+import numpy as np
 from botocore.client import Config
 
-# Set up logging
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Set up logging - records go through a queue so file/console writes
+# happen on the listener thread instead of the pipeline loop
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler('../logs/pipeline.log'),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('../logs/pipeline.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
 # Add ml-models to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+from pipeline_base import generate_sensor_batch
+
+def to_json_line(data):
+    """Serialize a record as one newline-terminated JSON line (bytes)"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data) + '\n').encode()
 
 class GrafanaOptimizedPipeline:
     def __init__(self):
@@ -32,7 +63,18 @@ class GrafanaOptimizedPipeline:
         
         self.detector = AnomalyDetector()
         self.load_model()
-        self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.sensors = ('sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005')
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
+        # Uploads run here so MinIO round-trips overlap instead of queueing
+        self.io_pool = ThreadPoolExecutor(max_workers=16)
+        # NDJSON lines per bucket, uploaded as one object per batch
+        self._minio_lines = {'bronze': [], 'silver': [], 'gold': []}
+        # Per-bucket key templates; only the timestamp changes between batches
+        # of the same hour
+        self._key_hour = None
+        self._key_templates = {}
         self.setup_database()
         self.setup_minio()
         
@@ -52,24 +94,25 @@ class GrafanaOptimizedPipeline:
         logger.info("✓ New model trained and saved")
     
     def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples)).round(2)
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples)).round(2)
+        sensor_numbers = rng.integers(1, 6, num_samples)
+        timestamp = datetime.now().isoformat()
+        
+        return [
+            {
+                'sensor_id': f'sensor_{sensor_number:03d}',
+                'timestamp': timestamp,
+                'temperature': temp,
+                'humidity': hum,
+                'is_anomaly': anomaly
+            }
+            for sensor_number, temp, hum, anomaly in zip(
+                sensor_numbers.tolist(), temperature.tolist(), humidity.tolist(), is_anomaly.tolist()
+            )
+        ]
     
     def setup_minio(self):
         logger.info("Setting up MinIO connection...")
@@ -90,7 +133,15 @@ class GrafanaOptimizedPipeline:
                         endpoint_url=endpoint,
                         aws_access_key_id='minioadmin',
                         aws_secret_access_key='minioadmin',
-                        config=Config(signature_version='s3v4'),
+                        config=Config(
+                            signature_version='s3v4',
+                            # Enough pooled connections for every upload worker
+                            max_pool_connections=64,
+                            tcp_keepalive=True,
+                            retries={'mode': 'adaptive', 'max_attempts': 3},
+                            # MinIO buckets aren't DNS names; skip virtual-host probing
+                            s3={'addressing_style': 'path'}
+                        ),
                         region_name='us-east-1'
                     )
                     
@@ -119,13 +170,22 @@ class GrafanaOptimizedPipeline:
     
     def setup_database(self):
         logger.info("Setting up PostgreSQL connection...")
+        
+        # Per-batch COPY buffers, flushed by flush_to_database()
+        self._readings_buf = io.StringIO()
+        self._alerts_buf = io.StringIO()
+        self._metric_rows = []
+        
         try:
             self.conn = psycopg2.connect(
                 host="localhost",
                 database="iot_analytics",
                 user="postgres",
                 password="postgres",
-                port="5432"
+                port="5432",
+                # Metric and reading commits skip the WAL fsync wait; a
+                # crash can only lose the last few hundred ms of them
+                options="-c synchronous_commit=off"
             )
             self.cursor = self.conn.cursor()
             
@@ -168,9 +228,11 @@ class GrafanaOptimizedPipeline:
                 )
             """)
             
-            # Create pipeline metrics table for Grafana dashboards
+            # Create pipeline metrics table for Grafana dashboards.
+            # UNLOGGED skips WAL: it is only dashboard telemetry and may be
+            # truncated after a crash.
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS pipeline_metrics (
+                CREATE UNLOGGED TABLE IF NOT EXISTS pipeline_metrics (
                     id SERIAL PRIMARY KEY,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     metric_name VARCHAR(100),
@@ -179,6 +241,19 @@ class GrafanaOptimizedPipeline:
                     tags JSONB
                 )
             """)
+            # A table created by an older version is still logged; converting
+            # rewrites it, so only do it once
+            self.cursor.execute("""
+                SELECT 1 FROM pg_class
+                WHERE relname = 'pipeline_metrics' AND relkind = 'r'
+                  AND relpersistence = 'p' AND pg_table_is_visible(oid)
+            """)
+            if self.cursor.fetchone():
+                self.cursor.execute("ALTER TABLE pipeline_metrics SET UNLOGGED")
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_pipeline_metrics_timestamp
+                ON pipeline_metrics (timestamp DESC)
+            """)
             
             # Create performance metrics table
             self.cursor.execute("""
@@ -193,9 +268,18 @@ class GrafanaOptimizedPipeline:
                 )
             """)
             
+            # Parsed once per session, reused by log_system_event()
+            self.cursor.execute("""
+                PREPARE ins_event AS
+                INSERT INTO system_events (event_type, event_status, message, details)
+                VALUES ($1, $2, $3, $4)
+            """)
+            
+            self.log_system_event('database_connection', 'success', 'All tables created')
+            # DEFAULT/daily partitions and retention, if the tables are partitioned
+            maintain_partitions(self.conn)
             self.conn.commit()
             logger.info("✓ PostgreSQL connected and tables created")
-            self.log_system_event('database_connection', 'success', 'All tables created')
             
         except Exception as e:
             logger.error(f"❌ Database setup failed: {e}")
@@ -207,148 +291,207 @@ class GrafanaOptimizedPipeline:
             return
             
         try:
-            self.cursor.execute("""
-                INSERT INTO system_events (event_type, event_status, message, details)
-                VALUES (%s, %s, %s, %s)
-            """, (event_type, status, message, json.dumps(details) if details else None))
-            self.conn.commit()
+            self.cursor.execute(
+                "EXECUTE ins_event (%s, %s, %s, %s)",
+                (event_type, status, message, Json(details) if details else None)
+            )
         except Exception as e:
             logger.error(f"Failed to log system event: {e}")
     
     def log_metric(self, metric_name, value, sensor_id=None, tags=None):
-        """Log metrics for Grafana dashboards"""
+        """Buffer a metric for Grafana dashboards, written by flush_metrics()"""
         if not self.conn:
             return
             
+        self._metric_rows.append((metric_name, value, sensor_id, Json(tags) if tags else None))
+    
+    def flush_metrics(self):
+        """Write all buffered metrics as one multi-row INSERT"""
+        if not self._metric_rows:
+            return
+            
         try:
-            self.cursor.execute("""
+            execute_values(self.cursor, """
                 INSERT INTO pipeline_metrics (metric_name, metric_value, sensor_id, tags)
-                VALUES (%s, %s, %s, %s)
-            """, (metric_name, value, sensor_id, json.dumps(tags) if tags else None))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Failed to log metric: {e}")
+                VALUES %s
+            """, self._metric_rows, page_size=500)
+        finally:
+            self._metric_rows.clear()
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.12  # 12% anomaly rate
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
-        }
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, 0.12, now)  # 12% anomaly rate
+    
+    def _put_object(self, bucket, key, body):
+        """Gzip and upload one NDJSON object (runs on the upload pool)"""
+        return self.s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=gzip.compress(body, compresslevel=6),
+            # Stored as a .jsonl.gz file, not a transfer encoding: readers
+            # (Spark, mc cat, browsers) get the gzip bytes and pick the
+            # codec from the key
+            ContentType='application/gzip'
+        )
+    
+    def _submit_upload(self, bucket, key, body):
+        return self.io_pool.submit(self._put_object, bucket, key, body)
     
     def save_to_minio(self, reading, prediction):
-        start_time = time.time()
-        
+        """Queue a reading for this batch's bronze and silver/gold objects"""
         if not self.s3_client:
             self.log_metric('minio_upload_failed', 1, reading['sensor_id'])
             return False
             
-        try:
-            data = {
-                'sensor_id': reading['sensor_id'],
-                'timestamp': reading['timestamp'].isoformat(),
-                'temperature': reading['temperature'],
-                'humidity': reading['humidity'],
-                'ml_prediction': prediction,
-                'actual_anomaly': reading['actual_anomaly']
-            }
+        data = {
+            'sensor_id': reading['sensor_id'],
+            'timestamp': reading['timestamp'].isoformat(),
+            'temperature': reading['temperature'],
+            'humidity': reading['humidity'],
+            'ml_prediction': prediction,
+            'actual_anomaly': reading['actual_anomaly']
+        }
+        line = to_json_line(data)
+        
+        # Bronze gets everything, then silver or gold based on prediction
+        self._minio_lines['bronze'].append(line)
+        if prediction == -1:
+            self._minio_lines['gold'].append(line)
+        else:
+            self._minio_lines['silver'].append(line)
+        return True
+    
+    def start_uploads(self, batch_now, batch_count):
+        """Start uploading each bucket's buffered readings as one NDJSON object"""
+        if not self.s3_client:
+            return None
             
-            # Save to bronze bucket
-            bronze_key = f"raw_data/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d/%H')}/{int(time.time())}.json"
-            self.s3_client.put_object(
-                Bucket='bronze',
-                Key=bronze_key,
-                Body=json.dumps(data),
-                ContentType='application/json'
-            )
+        start_time = time.time()
+        key_hour = (batch_now.date(), batch_now.hour)
+        if key_hour != self._key_hour:
+            date_prefix = batch_now.strftime('%Y/%m/%d')
+            hour_prefix = f"{date_prefix}/{batch_now.hour:02d}"
+            self._key_templates = {
+                'bronze': f"raw_data/{hour_prefix}/",
+                'silver': f"processed_data/{hour_prefix}/",
+                'gold': f"anomalies/{date_prefix}/"
+            }
+            self._key_hour = key_hour
+        # Bronze/silver keys match MonitoredPipeline's gzipped NDJSON objects;
+        # the batch number keeps two batches in the same second apart. Gold
+        # differs: one gzipped batch object per day prefix here, one plain
+        # .json per anomaly and sensor there
+        key_suffix = f"{int(batch_now.timestamp())}_{batch_count}.jsonl.gz"
+        keys = {bucket: prefix + key_suffix for bucket, prefix in self._key_templates.items()}
+        
+        futures = {}
+        for bucket, lines in self._minio_lines.items():
+            if lines:
+                futures[bucket] = self._submit_upload(bucket, keys[bucket], b''.join(lines))
+                lines.clear()
+        
+        return futures, keys, start_time
+    
+    def finish_uploads(self, pending):
+        """Wait for the uploads from start_uploads() and log their outcome"""
+        if not pending:
+            return
             
-            # Save to appropriate bucket based on prediction
-            if prediction == -1:
-                gold_key = f"anomalies/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d')}/{int(time.time())}.json"
-                self.s3_client.put_object(
-                    Bucket='gold',
-                    Key=gold_key,
-                    Body=json.dumps(data),
-                    ContentType='application/json'
-                )
-                logger.info(f"📁 Saved anomaly to MinIO: gold/{gold_key}")
+        futures, keys, start_time = pending
+        wait(futures.values())
+        upload_time = (time.time() - start_time) * 1000
+        
+        for bucket, future in futures.items():
+            error = future.exception()
+            if error:
+                logger.error(f"❌ MinIO save failed: {error}")
+                self.log_metric('minio_upload_failed', 1, tags={'bucket': bucket})
+                self.log_system_event('minio_upload', 'failed', str(error))
             else:
-                silver_key = f"processed_data/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d/%H')}/{int(time.time())}.json"
-                self.s3_client.put_object(
-                    Bucket='silver',
-                    Key=silver_key,
-                    Body=json.dumps(data),
-                    ContentType='application/json'
-                )
-            
-            upload_time = (time.time() - start_time) * 1000
-            self.log_metric('minio_upload_success', 1, reading['sensor_id'])
-            self.log_metric('minio_upload_time_ms', upload_time, reading['sensor_id'])
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ MinIO save failed: {e}")
-            self.log_metric('minio_upload_failed', 1, reading['sensor_id'])
-            self.log_system_event('minio_upload', 'failed', str(e))
-            return False
+                self.log_metric('minio_upload_success', 1, tags={'bucket': bucket})
+                if bucket == 'gold':
+                    logger.info(f"📁 Saved anomalies to MinIO: gold/{keys['gold']}")
+        
+        if futures:
+            self.log_metric('minio_upload_time_ms', upload_time)
     
     def save_to_database(self, reading, prediction):
+        """Buffer a reading (and alert) for the next COPY flush"""
+        if not self.conn:
+            return False
+            
+        self._readings_buf.write(
+            f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+            f"{reading['humidity']}\t{reading['actual_anomaly']}\t{prediction}\n"
+        )
+        
+        # Buffer anomaly alert if detected
+        if prediction == -1:
+            self._alerts_buf.write(
+                f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+                f"{reading['humidity']}\tML_DETECTED\n"
+            )
+        return True
+    
+    def _copy_buffer(self, buf, table):
+        """COPY a tab-separated buffer into table"""
+        if buf.tell() == 0:
+            return
+        buf.seek(0)
+        self.cursor.copy_expert(f"COPY {table} FROM STDIN", buf)
+    
+    def flush_to_database(self):
+        """Write all buffered rows; committed by commit_batch()"""
+        try:
+            if self._alerts_buf.tell():
+                # Anomaly alerts must be durable - wait for the fsync on this batch
+                self.cursor.execute("SET LOCAL synchronous_commit = on")
+            self._copy_buffer(
+                self._readings_buf,
+                "sensor_readings (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)"
+            )
+            self._copy_buffer(
+                self._alerts_buf,
+                "anomaly_alerts (sensor_id, timestamp, temperature, humidity, alert_type)"
+            )
+        finally:
+            for buf in (self._readings_buf, self._alerts_buf):
+                buf.seek(0)
+                buf.truncate(0)
+    
+    def commit_batch(self, pending_uploads=None):
+        """Persist the batch in one transaction while its MinIO uploads finish"""
         start_time = time.time()
         
         if not self.conn:
+            self.finish_uploads(pending_uploads)
             return False
             
         try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
+            # The COPYs run while the uploads are still in flight
+            self.flush_to_database()
             
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
+            db_time = (time.time() - start_time) * 1000
+            self.log_metric('db_save_success', 1)
+            self.log_metric('db_save_time_ms', db_time)
             
-            self.conn.commit()
+            self.finish_uploads(pending_uploads)
+            pending_uploads = None
             
-            db_time = (time.time() - start_time) * 1000
-            self.log_metric('db_save_success', 1, reading['sensor_id'])
-            self.log_metric('db_save_time_ms', db_time, reading['sensor_id'])
+            self.flush_metrics()
+            self.conn.commit()
             return True
             
         except Exception as e:
             logger.error(f"❌ Database save failed: {e}")
-            self.log_metric('db_save_failed', 1, reading['sensor_id'])
+            self.conn.rollback()
+            self._metric_rows.clear()
+            # Carried over into the next batch's transaction
+            self.log_metric('db_save_failed', 1)
             return False
+        finally:
+            if pending_uploads:
+                self.finish_uploads(pending_uploads)
     
     def run_pipeline(self):
         logger.info("🚀 Starting Grafana-Optimized IoT Pipeline")
@@ -358,34 +501,38 @@ class GrafanaOptimizedPipeline:
         batch_count = 0
         total_readings = 0
         total_anomalies = 0
+        next_tick = time.monotonic()
         
         try:
             while True:
                 batch_count += 1
                 batch_start_time = time.time()
+                batch_now = datetime.now()
                 batch_anomalies = 0
                 
-                logger.info(f"🔄 Processing Batch {batch_count}")
+                logger.debug(f"🔄 Processing Batch {batch_count}")
                 
                 # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    ml_start_time = time.time()
-                    
-                    reading = self.generate_sensor_reading(sensor_id)
-                    prediction = self.detector.predict([reading])[0]
-                    
-                    ml_time = (time.time() - ml_start_time) * 1000
+                features, readings = self.generate_batch(batch_now)
+                
+                # ML prediction for the whole batch in one call
+                ml_start_time = time.time()
+                predictions = self.detector.predict_ndarray(features).tolist()
+                ml_time = (time.time() - ml_start_time) * 1000
+                self.log_metric('ml_inference_time_ms', ml_time)
+                
+                for reading, prediction in zip(readings, predictions):
+                    sensor_id = reading['sensor_id']
                     
-                    # Save to MinIO and database
-                    minio_success = self.save_to_minio(reading, prediction)
-                    db_success = self.save_to_database(reading, prediction)
+                    # Buffer for MinIO and database
+                    self.save_to_minio(reading, prediction)
+                    self.save_to_database(reading, prediction)
                     
                     total_readings += 1
                     
                     # Log individual sensor metrics
                     self.log_metric('temperature', reading['temperature'], sensor_id)
                     self.log_metric('humidity', reading['humidity'], sensor_id)
-                    self.log_metric('ml_inference_time_ms', ml_time, sensor_id)
                     
                     if prediction == -1:
                         total_anomalies += 1
@@ -394,7 +541,10 @@ class GrafanaOptimizedPipeline:
                         logger.warning(f"🚨 ANOMALY: {sensor_id} - T:{reading['temperature']}°C H:{reading['humidity']}%")
                     else:
                         self.log_metric('normal_reading', 1, sensor_id)
-                        logger.info(f"✅ Normal: {sensor_id} - T:{reading['temperature']}°C H:{reading['humidity']}%")
+                        logger.debug(f"✅ Normal: {sensor_id} - T:{reading['temperature']}°C H:{reading['humidity']}%")
+                
+                # One NDJSON object per bucket for the whole batch
+                pending_uploads = self.start_uploads(batch_now, batch_count)
                 
                 # Log batch metrics
                 batch_time = (time.time() - batch_start_time) * 1000
@@ -406,10 +556,21 @@ class GrafanaOptimizedPipeline:
                 self.log_metric('total_anomalies', total_anomalies)
                 self.log_metric('anomaly_rate_percent', anomaly_rate)
                 
+                # One COPY per table plus one metrics INSERT, one commit
+                self.commit_batch(pending_uploads)
+                
                 logger.info(f"📊 Batch {batch_count}: {len(self.sensors)} readings, {batch_anomalies} anomalies, {batch_time:.1f}ms")
                 logger.info(f"📈 Total: {total_readings} readings, {total_anomalies} anomalies ({anomaly_rate:.1f}%)")
                 
-                time.sleep(10)  # 10 second intervals
+                # 10 second cadence measured from batch start, so processing
+                # time does not push every following batch later
+                next_tick += 10.0
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                else:
+                    logger.warning(f"⏱️ Batch {batch_count} overran its 10s budget by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             logger.info("🛑 Pipeline stopped by user")
@@ -418,7 +579,9 @@ class GrafanaOptimizedPipeline:
             logger.error(f"💥 Pipeline crashed: {e}")
             self.log_system_event('pipeline_crash', 'failed', str(e))
         finally:
+            self.io_pool.shutdown(wait=True)
             if self.conn:
+                self.conn.commit()
                 self.conn.close()
             logger.info("🏁 Pipeline shutdown complete")
 
@@ -1,19 +1,35 @@
 import sys
 import os
+import io
 import time
 import psycopg2
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import random
+import numpy as np
 
 # Add ml-models to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
+ML_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ml-models')
+if ML_MODELS_DIR not in sys.path:
+    sys.path.append(ML_MODELS_DIR)
+# Shared postgres_client lives in the repo root
+REPO_DIR = os.path.dirname(ML_MODELS_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.append(REPO_DIR)
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+from pipeline_base import generate_sensor_batch
 
 class GrafanaPipeline:
     def __init__(self):
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
+        # Sink stage: one writer thread owns the psycopg2 connection after setup
+        self.db_pool = ThreadPoolExecutor(max_workers=1)
+        self._batch_write = None
         self.setup_database()
         
     def load_model(self):
@@ -31,26 +47,31 @@ class GrafanaPipeline:
         print("SUCCESS: Model trained and saved")
     
     def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples)).round(2)
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples)).round(2)
+        sensor_ids = np.array(self.sensors)[rng.integers(0, len(self.sensors), num_samples)]
+        timestamp = datetime.now().isoformat()
+        
+        return [
+            {
+                'sensor_id': sensor_id,
+                'timestamp': timestamp,
+                'temperature': temp,
+                'humidity': hum,
+                'is_anomaly': anomaly
+            }
+            for sensor_id, temp, hum, anomaly in zip(
+                sensor_ids.tolist(), temperature.tolist(), humidity.tolist(), is_anomaly.tolist()
+            )
+        ]
     
     def setup_database(self):
+        # Per-batch COPY buffers, flushed by flush_to_database()
+        self._readings_buf = io.StringIO()
+        self._alerts_buf = io.StringIO()
+        
         try:
             self.conn = psycopg2.connect(
                 host="localhost",
@@ -75,6 +96,16 @@ class GrafanaPipeline:
                 )
             """)
             
+            # Grafana panels filter by time range and by sensor
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sensor_readings_timestamp
+                ON sensor_readings USING BRIN (timestamp) WITH (pages_per_range = 32)
+            """)
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor_timestamp
+                ON sensor_readings (sensor_id, timestamp DESC)
+            """)
+            
             self.cursor.execute("""
                 CREATE TABLE IF NOT EXISTS anomaly_alerts (
                     id SERIAL PRIMARY KEY,
@@ -87,6 +118,8 @@ class GrafanaPipeline:
                 )
             """)
             
+            # DEFAULT/daily partitions and retention, if the tables are partitioned
+            maintain_partitions(self.conn)
             self.conn.commit()
             print("SUCCESS: Database setup complete")
             
@@ -94,61 +127,66 @@ class GrafanaPipeline:
             print(f"Database connection failed: {e}")
             self.conn = None
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.08  # 8% anomaly rate
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
-        }
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, 0.08, now)  # 8% anomaly rate
     
     def save_to_database(self, reading, prediction):
+        """Buffer a reading (and alert) for the next COPY flush"""
         if not self.conn:
             return
             
-        try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
-            
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
+        self._readings_buf.write(
+            f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+            f"{reading['humidity']}\t{reading['actual_anomaly']}\t{prediction}\n"
+        )
+        
+        # Buffer anomaly alert if detected
+        if prediction == -1:
+            self._alerts_buf.write(
+                f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+                f"{reading['humidity']}\tML_DETECTED\n"
+            )
+    
+    def _copy_buffer(self, buf, table):
+        """COPY a tab-separated buffer into table"""
+        if buf.tell() == 0:
+            return
+        buf.seek(0)
+        self.cursor.copy_expert(f"COPY {table} FROM STDIN", buf)
+    
+    def take_batch(self):
+        """Hand off the buffered rows and start fresh buffers for the next batch"""
+        batch = (self._readings_buf, self._alerts_buf)
+        self._readings_buf = io.StringIO()
+        self._alerts_buf = io.StringIO()
+        return batch
+    
+    def flush_to_database(self, readings_buf, alerts_buf):
+        """Write one batch's rows in one transaction (runs on db_pool)"""
+        if not self.conn:
+            return
             
+        try:
+            self._copy_buffer(
+                readings_buf,
+                "sensor_readings (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)"
+            )
+            self._copy_buffer(
+                alerts_buf,
+                "anomaly_alerts (sensor_id, timestamp, temperature, humidity, alert_type)"
+            )
             self.conn.commit()
             
         except Exception as e:
             print(f"Database save error: {e}")
+            self.conn.rollback()
+    
+    def submit_batch_write(self):
+        """Queue the batch for the writer thread, keeping at most one write in flight"""
+        if self._batch_write:
+            self._batch_write.result()
+        self._batch_write = self.db_pool.submit(self.flush_to_database, *self.take_batch())
     
     def run_realtime_pipeline(self):
         print("Starting Real-Time IoT Pipeline for Grafana")
@@ -157,16 +195,17 @@ class GrafanaPipeline:
         
         reading_count = 0
         anomaly_count = 0
+        next_tick = time.monotonic()
         
         try:
             while True:
                 # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    
-                    # ML prediction
-                    prediction = self.detector.predict([reading])[0]
-                    
+                features, readings = self.generate_batch(datetime.now())
+                
+                # ML prediction for the whole batch in one call
+                predictions = self.detector.predict_ndarray(features).tolist()
+                
+                for reading, prediction in zip(readings, predictions):
                     # Save to database
                     self.save_to_database(reading, prediction)
                     
@@ -175,15 +214,26 @@ class GrafanaPipeline:
                     if prediction == -1:
                         anomaly_count += 1
                         print(f"ANOMALY DETECTED: {reading['sensor_id']} - T:{reading['temperature']}°C H:{reading['humidity']}%")
-                    else:
-                        print(f"Normal: {reading['sensor_id']} - T:{reading['temperature']}°C H:{reading['humidity']}%")
+                
+                # One COPY per table for the whole batch, written by the sink
+                # thread while this loop sleeps and generates the next batch
+                self.submit_batch_write()
                 
                 print(f"Batch complete. Total: {reading_count}, Anomalies: {anomaly_count}")
-                time.sleep(3)  # 3 second intervals
+                # 3 second cadence measured from batch start, so processing
+                # time does not push every following batch later
+                next_tick += 3.0
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                else:
+                    print(f"WARNING: Batch overran its 3s budget by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             print(f"\nPipeline stopped. Processed {reading_count} readings, detected {anomaly_count} anomalies")
         finally:
+            self.db_pool.shutdown(wait=True)
             if self.conn:
                 self.conn.close()
 
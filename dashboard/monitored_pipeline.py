@@ -1,31 +1,74 @@
 import sys
 import os
+import io
+import gzip
 import time
 import json
 import psycopg2
 import boto3
 import logging
+import logging.handlers
+import queue
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import random
+import numpy as np
 from botocore.client import Config
 from botocore.exceptions import ClientError, EndpointConnectionError
 
-# Set up comprehensive logging
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Set up comprehensive logging - records go through a queue so file/console
+# writes happen on the listener thread instead of the pipeline loop
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [
+    # delay: the file is opened on first write, after __init__ creates ../logs
+    logging.FileHandler('../logs/pipeline.log', delay=True),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('../logs/pipeline.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
 # Add ml-models to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
+ML_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ml-models')
+if ML_MODELS_DIR not in sys.path:
+    sys.path.append(ML_MODELS_DIR)
+# Shared postgres_client lives in the repo root
+REPO_DIR = os.path.dirname(ML_MODELS_DIR)
+if REPO_DIR not in sys.path:
+    sys.path.append(REPO_DIR)
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+from pipeline_base import generate_sensor_batch
+
+def to_json(data):
+    """Serialize a record as JSON bytes"""
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
 
 class MonitoredPipeline:
+    # Bronze/silver objects are cut at whichever limit is reached first
+    LAKE_FLUSH_RECORDS = 1000
+    LAKE_FLUSH_SECONDS = 60
+    # MinIO key templates, filled from the per-batch batch_key_parts()
+    LAKE_KEY = "{prefix}/{date_hour}/{key_id}.jsonl.gz".format
+    GOLD_KEY = "{prefix}{date_day}/{key_id}.json".format
+    
     def __init__(self):
         # Create logs directory
         os.makedirs('../logs', exist_ok=True)
@@ -44,6 +87,23 @@ class MonitoredPipeline:
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
+        # Fixed per-sensor part of each gold key
+        self._gold_prefixes = {sensor_id: f"anomalies/{sensor_id}/" for sensor_id in self.sensors}
+        # MinIO PUTs run here so they overlap the database flush
+        self.io_pool = ThreadPoolExecutor(max_workers=8)
+        self._pending_uploads = []
+        # NDJSON lines waiting to be uploaded as one gzipped object per bucket
+        self._lake_bufs = {'bronze': io.BytesIO(), 'silver': io.BytesIO()}
+        self._lake_records = 0
+        self._lake_started = time.monotonic()
+        # Single writer thread that owns the psycopg2 connection after setup
+        self.db_pool = ThreadPoolExecutor(max_workers=1)
+        self._batch_write = None
+        self._border = "=" * 60
+        self._show_dashboard = sys.stdout.isatty() or bool(os.getenv('IOT_DASH'))
         self.setup_database()
         self.setup_minio()
         
@@ -63,24 +123,25 @@ class MonitoredPipeline:
         logger.info("✓ New model trained and saved")
     
     def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples)).round(2)
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples)).round(2)
+        sensor_ids = np.array(self.sensors)[rng.integers(0, len(self.sensors), num_samples)]
+        timestamp = datetime.now().isoformat()
+        
+        return [
+            {
+                'sensor_id': sensor_id,
+                'timestamp': timestamp,
+                'temperature': temp,
+                'humidity': hum,
+                'is_anomaly': anomaly
+            }
+            for sensor_id, temp, hum, anomaly in zip(
+                sensor_ids.tolist(), temperature.tolist(), humidity.tolist(), is_anomaly.tolist()
+            )
+        ]
     
     def setup_minio(self):
         logger.info("Setting up MinIO connection...")
@@ -103,7 +164,15 @@ class MonitoredPipeline:
                         endpoint_url=endpoint,
                         aws_access_key_id='minioadmin',
                         aws_secret_access_key='minioadmin',
-                        config=Config(signature_version='s3v4'),
+                        config=Config(
+                            signature_version='s3v4',
+                            # At least one pooled connection per upload worker
+                            max_pool_connections=32,
+                            tcp_keepalive=True,
+                            retries={'mode': 'standard', 'max_attempts': 2},
+                            # MinIO buckets aren't DNS names; skip virtual-host probing
+                            s3={'addressing_style': 'path'}
+                        ),
                         region_name='us-east-1'
                     )
                     
@@ -133,6 +202,12 @@ class MonitoredPipeline:
     
     def setup_database(self):
         logger.info("Setting up PostgreSQL connection...")
+        
+        # Per-batch COPY buffers, flushed by flush_to_database()
+        self._readings_buf = io.StringIO()
+        self._alerts_buf = io.StringIO()
+        self._buffered_readings = 0
+        
         try:
             self.conn = psycopg2.connect(
                 host="localhost",
@@ -157,6 +232,16 @@ class MonitoredPipeline:
                 )
             """)
             
+            # Grafana panels filter by time range and by sensor
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sensor_readings_timestamp
+                ON sensor_readings USING BRIN (timestamp) WITH (pages_per_range = 32)
+            """)
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor_timestamp
+                ON sensor_readings (sensor_id, timestamp DESC)
+            """)
+            
             self.cursor.execute("""
                 CREATE TABLE IF NOT EXISTS anomaly_alerts (
                     id SERIAL PRIMARY KEY,
@@ -170,8 +255,10 @@ class MonitoredPipeline:
             """)
             
             # Create pipeline monitoring table
+            # Dashboard telemetry only: UNLOGGED skips WAL, and the table may
+            # be truncated after a crash
             self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS pipeline_stats (
+                CREATE UNLOGGED TABLE IF NOT EXISTS pipeline_stats (
                     id SERIAL PRIMARY KEY,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     total_readings INTEGER,
@@ -182,7 +269,26 @@ class MonitoredPipeline:
                     uptime_seconds INTEGER
                 )
             """)
+            # A table created before this change is still logged; converting
+            # rewrites it, so only do it once
+            self.cursor.execute("""
+                SELECT 1 FROM pg_class
+                WHERE relname = 'pipeline_stats' AND relkind = 'r'
+                  AND relpersistence = 'p' AND pg_table_is_visible(oid)
+            """)
+            if self.cursor.fetchone():
+                self.cursor.execute("ALTER TABLE pipeline_stats SET UNLOGGED")
+            
+            # Parsed once per session, reused by update_pipeline_stats()
+            self.cursor.execute("""
+                PREPARE ins_stats AS
+                INSERT INTO pipeline_stats
+                (total_readings, anomalies_detected, minio_uploads, db_saves, errors, uptime_seconds)
+                VALUES ($1, $2, $3, $4, $5, $6)
+            """)
             
+            # DEFAULT/daily partitions and retention, if the tables are partitioned
+            maintain_partitions(self.conn)
             self.conn.commit()
             logger.info("✓ PostgreSQL connected and tables created")
             
@@ -190,25 +296,12 @@ class MonitoredPipeline:
             logger.error(f"❌ Database setup failed: {e}")
             self.conn = None
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.15  # 15% anomaly rate
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
-        }
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, 0.15, now)  # 15% anomaly rate
     
-    def save_to_minio(self, reading, prediction):
+    def save_to_minio(self, reading, prediction, key_parts):
+        """Buffer a reading for the bronze/silver objects; anomalies go to gold right away"""
         if not self.s3_client:
             logger.debug("Skipping MinIO save - no connection")
             return False
@@ -222,37 +315,26 @@ class MonitoredPipeline:
                 'ml_prediction': prediction,
                 'actual_anomaly': reading['actual_anomaly']
             }
+            body = to_json(data)
             
-            # Save to bronze bucket (raw data)
-            bronze_key = f"raw_data/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d/%H')}/{int(time.time())}.json"
+            # Bronze gets everything, silver the normal readings
+            self._lake_bufs['bronze'].write(body + b'\n')
+            self._lake_records += 1
             
-            self.s3_client.put_object(
-                Bucket='bronze',
-                Key=bronze_key,
-                Body=json.dumps(data),
-                ContentType='application/json'
-            )
-            
-            # Save to appropriate bucket based on prediction
             if prediction == -1:
-                gold_key = f"anomalies/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d')}/{int(time.time())}.json"
-                self.s3_client.put_object(
+                # Anomalies are uploaded individually so alerts are not delayed
+                date_hour, date_day, key_id = key_parts
+                gold_key = self.GOLD_KEY(prefix=self._gold_prefixes[reading['sensor_id']], date_day=date_day, key_id=key_id)
+                future = self.io_pool.submit(
+                    self.s3_client.put_object,
                     Bucket='gold',
                     Key=gold_key,
-                    Body=json.dumps(data),
+                    Body=body,
                     ContentType='application/json'
                 )
-                logger.info(f"📁 Saved anomaly to MinIO: gold/{gold_key}")
+                self._pending_uploads.append((future, 'gold', gold_key, 0))
             else:
-                silver_key = f"processed_data/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d/%H')}/{int(time.time())}.json"
-                self.s3_client.put_object(
-                    Bucket='silver',
-                    Key=silver_key,
-                    Body=json.dumps(data),
-                    ContentType='application/json'
-                )
-            
-            self.stats['minio_uploads'] += 1
+                self._lake_bufs['silver'].write(body + b'\n')
             return True
             
         except Exception as e:
@@ -260,94 +342,188 @@ class MonitoredPipeline:
             self.stats['errors'] += 1
             return False
     
+    def flush_lake_buffers(self, key_parts, force=False):
+        """Upload the buffered bronze/silver lines once enough records or time have accumulated"""
+        if not self.s3_client:
+            return
+            
+        age = time.monotonic() - self._lake_started
+        if not force and self._lake_records < self.LAKE_FLUSH_RECORDS and age < self.LAKE_FLUSH_SECONDS:
+            return
+        
+        date_hour, date_day, key_id = key_parts
+        for bucket, prefix in (('bronze', 'raw_data'), ('silver', 'processed_data')):
+            buf = self._lake_bufs[bucket]
+            if buf.tell():
+                key = self.LAKE_KEY(prefix=prefix, date_hour=date_hour, key_id=key_id)
+                future = self.io_pool.submit(self._put_ndjson_gz, bucket, key, buf.getvalue())
+                # minio_uploads counts readings, which all land in bronze
+                readings = self._lake_records if bucket == 'bronze' else 0
+                self._pending_uploads.append((future, bucket, key, readings))
+                buf.seek(0)
+                buf.truncate(0)
+        
+        self._lake_records = 0
+        self._lake_started = time.monotonic()
+    
+    def batch_key_parts(self, batch_now, batch_count):
+        """Format the MinIO key parts (date_hour, date_day, key_id) once per batch"""
+        # Batch number keeps keys unique even if two batches share a second
+        date_day = batch_now.strftime('%Y/%m/%d')
+        return f"{date_day}/{batch_now.hour:02d}", date_day, f"{int(batch_now.timestamp())}_{batch_count}"
+    
+    def _put_ndjson_gz(self, bucket, key, body):
+        """Gzip and upload one NDJSON object (runs on the upload pool)"""
+        return self.s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=gzip.compress(body, compresslevel=6),
+            # Stored as a .jsonl.gz file, not a transfer encoding: readers
+            # (Spark, mc cat, browsers) get the gzip bytes and pick the
+            # codec from the key
+            ContentType='application/gzip'
+        )
+    
+    def finish_uploads(self):
+        """Wait for the started MinIO uploads and record their outcome"""
+        for future, bucket, key, readings in self._pending_uploads:
+            error = future.exception()
+            if error:
+                logger.error(f"❌ MinIO save failed: {error}")
+                self.stats['errors'] += 1
+                continue
+            
+            if bucket == 'gold':
+                logger.info(f"📁 Saved anomaly to MinIO: gold/{key}")
+            else:
+                logger.info(f"📁 Saved batch object to MinIO: {bucket}/{key}")
+            self.stats['minio_uploads'] += readings
+        
+        self._pending_uploads.clear()
+    
     def save_to_database(self, reading, prediction):
+        """Buffer a reading (and alert) for the next COPY flush"""
         if not self.conn:
             logger.debug("Skipping DB save - no connection")
             return False
             
+        self._readings_buf.write(
+            f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+            f"{reading['humidity']}\t{reading['actual_anomaly']}\t{prediction}\n"
+        )
+        
+        # Buffer anomaly alert if detected
+        if prediction == -1:
+            self._alerts_buf.write(
+                f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+                f"{reading['humidity']}\tML_DETECTED\n"
+            )
+        
+        self._buffered_readings += 1
+        return True
+    
+    def _copy_buffer(self, buf, table):
+        """COPY a tab-separated buffer into table"""
+        if buf.tell() == 0:
+            return
+        buf.seek(0)
+        self.cursor.copy_expert(f"COPY {table} FROM STDIN", buf)
+    
+    def flush_to_database(self):
+        """COPY all buffered rows; committed by write_batch()"""
         try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
-            
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
+            self._copy_buffer(
+                self._readings_buf,
+                "sensor_readings (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)"
+            )
+            self._copy_buffer(
+                self._alerts_buf,
+                "anomaly_alerts (sensor_id, timestamp, temperature, humidity, alert_type)"
+            )
+        finally:
+            self._buffered_readings = 0
+            for buf in (self._readings_buf, self._alerts_buf):
+                buf.seek(0)
+                buf.truncate(0)
+    
+    def update_pipeline_stats(self, pending_saves=0):
+        """Insert the current stats row; committed by write_batch()"""
+        uptime = (datetime.now() - self.stats['start_time']).total_seconds()
+        
+        self.cursor.execute("EXECUTE ins_stats (%s, %s, %s, %s, %s, %s)", (
+            self.stats['total_readings'],
+            self.stats['anomalies_detected'],
+            self.stats['minio_uploads'],
+            self.stats['db_saves'] + pending_saves,
+            self.stats['errors'],
+            int(uptime)
+        ))
+    
+    def write_batch(self):
+        """Persist the batch's rows and stats in one transaction (runs on db_pool)"""
+        if not self.conn:
+            self.finish_uploads()
+            return False
+        
+        saved = self._buffered_readings
+        try:
+            # The COPYs run while the uploads are still in flight
+            self.flush_to_database()
+            self.finish_uploads()
             
+            self.update_pipeline_stats(pending_saves=saved)
+            # Delivered on commit; wakes web_monitor's /api/stream listeners
+            self.cursor.execute("NOTIFY pipeline_batch")
             self.conn.commit()
-            self.stats['db_saves'] += 1
+            self.stats['db_saves'] += saved
             return True
             
         except Exception as e:
             logger.error(f"❌ Database save failed: {e}")
+            self.conn.rollback()
             self.stats['errors'] += 1
             return False
+        finally:
+            # No-op unless the database failed before the uploads were collected
+            self.finish_uploads()
     
-    def update_pipeline_stats(self):
-        if not self.conn:
+    def wait_for_batch_write(self):
+        """Block until the previous batch's write_batch() has finished"""
+        if self._batch_write:
+            self._batch_write.result()
+            self._batch_write = None
+    
+    def print_status_dashboard(self, now):
+        # Only render for an interactive terminal (or when IOT_DASH is set)
+        if not self._show_dashboard:
             return
             
-        try:
-            uptime = (datetime.now() - self.stats['start_time']).total_seconds()
-            
-            self.cursor.execute("""
-                INSERT INTO pipeline_stats 
-                (total_readings, anomalies_detected, minio_uploads, db_saves, errors, uptime_seconds)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                self.stats['total_readings'],
-                self.stats['anomalies_detected'],
-                self.stats['minio_uploads'],
-                self.stats['db_saves'],
-                self.stats['errors'],
-                int(uptime)
-            ))
-            
-            self.conn.commit()
-            
-        except Exception as e:
-            logger.error(f"Stats update failed: {e}")
-    
-    def print_status_dashboard(self):
-        uptime = datetime.now() - self.stats['start_time']
+        uptime = now - self.stats['start_time']
         
-        print("\n" + "="*60)
-        print("📊 PIPELINE STATUS DASHBOARD")
-        print("="*60)
-        print(f"⏱️  Uptime: {uptime}")
-        print(f"📈 Total Readings: {self.stats['total_readings']}")
-        print(f"🚨 Anomalies Detected: {self.stats['anomalies_detected']}")
-        print(f"📁 MinIO Uploads: {self.stats['minio_uploads']}")
-        print(f"💾 DB Saves: {self.stats['db_saves']}")
-        print(f"❌ Errors: {self.stats['errors']}")
+        lines = [
+            "",
+            self._border,
+            "📊 PIPELINE STATUS DASHBOARD",
+            self._border,
+            f"⏱️  Uptime: {uptime}",
+            f"📈 Total Readings: {self.stats['total_readings']}",
+            f"🚨 Anomalies Detected: {self.stats['anomalies_detected']}",
+            f"📁 MinIO Uploads: {self.stats['minio_uploads']}",
+            f"💾 DB Saves: {self.stats['db_saves']}",
+            f"❌ Errors: {self.stats['errors']}"
+        ]
         
         if self.stats['total_readings'] > 0:
             anomaly_rate = (self.stats['anomalies_detected'] / self.stats['total_readings']) * 100
-            print(f"📊 Anomaly Rate: {anomaly_rate:.1f}%")
+            lines.append(f"📊 Anomaly Rate: {anomaly_rate:.1f}%")
+        
+        lines.append(f"🔗 MinIO Status: {'✓ Connected' if self.s3_client else '❌ Disconnected'}")
+        lines.append(f"🗄️  DB Status: {'✓ Connected' if self.conn else '❌ Disconnected'}")
+        lines.append(self._border)
         
-        print(f"🔗 MinIO Status: {'✓ Connected' if self.s3_client else '❌ Disconnected'}")
-        print(f"🗄️  DB Status: {'✓ Connected' if self.conn else '❌ Disconnected'}")
-        print("="*60)
+        # One write instead of a print per line
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
     
     def run_pipeline(self):
         logger.info("🚀 Starting Monitored IoT Pipeline")
@@ -356,23 +532,29 @@ class MonitoredPipeline:
         logger.info("📋 Logs: ../logs/pipeline.log")
         
         batch_count = 0
+        next_tick = time.monotonic()
         
         try:
             while True:
                 batch_count += 1
                 batch_anomalies = 0
                 
-                logger.info(f"🔄 Processing Batch {batch_count}")
+                logger.debug(f"🔄 Processing Batch {batch_count}")
+                
+                # Buffers are reused, so the previous write must be done
+                self.wait_for_batch_write()
                 
                 # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    
-                    # ML prediction
-                    prediction = self.detector.predict([reading])[0]
-                    
+                batch_now = datetime.now()
+                key_parts = self.batch_key_parts(batch_now, batch_count)
+                features, readings = self.generate_batch(batch_now)
+                
+                # ML prediction for the whole batch in one call
+                predictions = self.detector.predict_ndarray(features).tolist()
+                
+                for reading, prediction in zip(readings, predictions):
                     # Save to MinIO and database
-                    minio_success = self.save_to_minio(reading, prediction)
+                    minio_success = self.save_to_minio(reading, prediction, key_parts)
                     db_success = self.save_to_database(reading, prediction)
                     
                     self.stats['total_readings'] += 1
@@ -382,20 +564,39 @@ class MonitoredPipeline:
                         batch_anomalies += 1
                         logger.warning(f"🚨 ANOMALY: {reading['sensor_id']} - T:{reading['temperature']}°C H:{reading['humidity']}%")
                     else:
-                        logger.info(f"✅ Normal: {reading['sensor_id']} - T:{reading['temperature']}°C H:{reading['humidity']}%")
+                        logger.debug(f"✅ Normal: {reading['sensor_id']} - T:{reading['temperature']}°C H:{reading['humidity']}%")
+                
+                logger.info(f"📊 Batch {batch_count}: {len(readings)} readings, {batch_anomalies} anomalies")
+                
+                # Cut bronze/silver objects once the buffers are full or old enough
+                self.flush_lake_buffers(key_parts)
                 
-                # Update stats and show dashboard
-                self.update_pipeline_stats()
-                self.print_status_dashboard()
+                # COPY, upload collection and stats run on the writer thread
+                # while this loop shows the dashboard and sleeps
+                self._batch_write = self.db_pool.submit(self.write_batch)
+                self.print_status_dashboard(batch_now)
                 
-                logger.info(f"⏳ Waiting 15 seconds before next batch...")
-                time.sleep(15)  # 15 second intervals
+                # 15 second cadence measured from batch start, so processing
+                # time does not push every following batch later
+                next_tick += 15.0
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    logger.info(f"⏳ Waiting {sleep_for:.1f} seconds before next batch...")
+                    time.sleep(sleep_for)
+                else:
+                    logger.warning(f"⏱️ Batch {batch_count} overran its 15s budget by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             logger.info("🛑 Pipeline stopped by user")
         except Exception as e:
             logger.error(f"💥 Pipeline crashed: {e}")
         finally:
+            self.db_pool.shutdown(wait=True)
+            # Upload whatever is still buffered so no readings are dropped
+            self.flush_lake_buffers(self.batch_key_parts(datetime.now(), batch_count), force=True)
+            self.finish_uploads()
+            self.io_pool.shutdown(wait=True)
             if self.conn:
                 self.conn.close()
             logger.info("🏁 Pipeline shutdown complete")
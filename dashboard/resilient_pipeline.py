@@ -1,11 +1,19 @@
 import sys
 import os
+import io
 import time
 import json
 import psycopg2
 import logging
-from datetime import datetime
-import random
+import threading
+import queue
+from datetime import date, datetime, timedelta
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Set up logging with better error handling
 os.makedirs('../logs', exist_ok=True)
@@ -19,9 +27,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Add ml-models to path
+DB_PARAMS = {
+    'host': "localhost",
+    'database': "iot_analytics",
+    'user': "postgres",
+    'password': "postgres",
+    'port': "5432"
+}
+
+def to_json_line(data):
+    """Serialize a record as one JSON line (bytes); datetimes become ISO 8601"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, default=datetime.isoformat) + '\n').encode()
+
+# Batch write statements, built once instead of per flush
+COPY_SENSOR_READINGS = """
+    COPY sensor_readings (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
+    FROM STDIN
+"""
+COPY_ANOMALY_ALERTS = """
+    COPY anomaly_alerts (sensor_id, timestamp, temperature, humidity, alert_type)
+    FROM STDIN
+"""
+COPY_PIPELINE_METRICS = """
+    COPY pipeline_metrics (metric_name, metric_value, sensor_id, tags)
+    FROM STDIN
+"""
+
+# Escapes for free-text COPY fields
+COPY_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+# Add ml-models (and the shared postgres_client) to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+from pipeline_base import generate_sensor_batch
 
 class ResilientPipeline:
     def __init__(self):
@@ -30,6 +72,18 @@ class ResilientPipeline:
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
+        
+        # Local file writes are handed to a background writer thread
+        for layer in ('bronze', 'silver', 'gold'):
+            os.makedirs(f'../data/{layer}', exist_ok=True)
+        self._hour_key = None
+        self._hour_ends = 0
+        self._file_queue = queue.Queue()
+        self._file_writer = threading.Thread(target=self._file_writer_loop, daemon=True)
+        self._file_writer.start()
         
         # Initialize connections
         self.db_connected = self.setup_database()
@@ -43,6 +97,8 @@ class ResilientPipeline:
             'errors': 0,
             'start_time': datetime.now()
         }
+        # Elapsed time for the status row, without a wall-clock read
+        self._start_mono = time.monotonic()
         
     def load_model(self):
         try:
@@ -60,61 +116,56 @@ class ResilientPipeline:
         logger.info("✓ New model trained and saved")
     
     def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        """Training set as an (N, 2) temperature/humidity array for detector.train()"""
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples))
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples))
+        return np.column_stack((temperature, humidity)).round(2)
     
     def setup_database(self):
         logger.info("Setting up PostgreSQL connection...")
+        
+        # Per-batch buffers, written by commit_batch()
+        self._readings_buf = io.StringIO()
+        self._alerts_buf = io.StringIO()
+        self._buffered_readings = 0
+        self._metrics_buf = io.StringIO()
+        
         try:
-            self.conn = psycopg2.connect(
-                host="localhost",
-                database="iot_analytics",
-                user="postgres",
-                password="postgres",
-                port="5432"
-            )
+            self.conn = psycopg2.connect(**DB_PARAMS)
             self.cursor = self.conn.cursor()
             
             # Create all necessary tables
             tables = [
+                # Partitioned by day (see postgres_client.maintain_partitions);
+                # the partition key has to be part of the primary key
                 """CREATE TABLE IF NOT EXISTS sensor_readings (
-                    id SERIAL PRIMARY KEY,
+                    id SERIAL,
                     sensor_id VARCHAR(50),
                     timestamp TIMESTAMP,
                     temperature FLOAT,
                     humidity FLOAT,
                     is_anomaly BOOLEAN,
                     ml_prediction INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )""",
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp)""",
                 
                 """CREATE TABLE IF NOT EXISTS anomaly_alerts (
-                    id SERIAL PRIMARY KEY,
+                    id SERIAL,
                     sensor_id VARCHAR(50),
                     timestamp TIMESTAMP,
                     temperature FLOAT,
                     humidity FLOAT,
                     alert_type VARCHAR(50),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )""",
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp)""",
                 
-                """CREATE TABLE IF NOT EXISTS system_events (
+                # Monitoring tables are UNLOGGED: no WAL, and Postgres
+                # truncates them after a crash - acceptable for telemetry
+                """CREATE UNLOGGED TABLE IF NOT EXISTS system_events (
                     id SERIAL PRIMARY KEY,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     event_type VARCHAR(100),
@@ -123,16 +174,19 @@ class ResilientPipeline:
                     details TEXT
                 )""",
                 
+                # A partitioned table cannot itself be UNLOGGED; its daily
+                # partitions are (postgres_client.UNLOGGED_PARTITIONS)
                 """CREATE TABLE IF NOT EXISTS pipeline_metrics (
-                    id SERIAL PRIMARY KEY,
+                    id SERIAL,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     metric_name VARCHAR(100),
                     metric_value FLOAT,
                     sensor_id VARCHAR(50),
-                    tags TEXT
-                )""",
+                    tags TEXT,
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp)""",
                 
-                """CREATE TABLE IF NOT EXISTS pipeline_status (
+                """CREATE UNLOGGED TABLE IF NOT EXISTS pipeline_status (
                     id SERIAL PRIMARY KEY,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     total_readings INTEGER,
@@ -148,9 +202,68 @@ class ResilientPipeline:
             for table_sql in tables:
                 self.cursor.execute(table_sql)
             
-            self.conn.commit()
+            # Tables created by older versions are still logged; converting
+            # rewrites the table, so only do it once
+            self.cursor.execute("""
+                SELECT relname FROM pg_class
+                WHERE relname IN ('system_events', 'pipeline_metrics', 'pipeline_status')
+                  AND relkind = 'r' AND relpersistence = 'p' AND pg_table_is_visible(oid)
+            """)
+            for (table,) in self.cursor.fetchall():
+                self.cursor.execute(f"ALTER TABLE {table} SET UNLOGGED")
+            
+            maintain_partitions(self.conn)
+            
+            # Every read path filters on a recent time range; BRIN suits these
+            # append-only tables and stays tiny
+            indexes = [
+                """CREATE INDEX IF NOT EXISTS idx_sensor_readings_timestamp
+                   ON sensor_readings USING BRIN (timestamp) WITH (pages_per_range = 32)""",
+                
+                """CREATE INDEX IF NOT EXISTS idx_anomaly_alerts_timestamp
+                   ON anomaly_alerts USING BRIN (timestamp) WITH (pages_per_range = 32)""",
+                
+                # Latest readings per sensor
+                """CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor_timestamp
+                   ON sensor_readings (sensor_id, timestamp DESC)"""
+            ]
+            
+            for index_sql in indexes:
+                self.cursor.execute(index_sql)
+            
+            # Per-minute anomaly rollup for the web monitor's timeline; the
+            # unique index is what allows REFRESH ... CONCURRENTLY
+            self.cursor.execute("""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS anomaly_per_minute AS
+                SELECT DATE_TRUNC('minute', timestamp) as minute, COUNT(*) as count
+                FROM anomaly_alerts
+                WHERE timestamp > NOW() - INTERVAL '2 hours'
+                GROUP BY minute
+            """)
+            self.cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_anomaly_per_minute_minute
+                ON anomaly_per_minute (minute)
+            """)
+            
+            # Parsed once per session; readings, alerts and metrics already
+            # go through COPY / multi-row INSERT
+            self.cursor.execute("""
+                PREPARE ins_status AS
+                INSERT INTO pipeline_status
+                (total_readings, anomalies_detected, db_saves, errors, uptime_seconds, minio_status, db_status)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """)
+            self.cursor.execute("""
+                PREPARE ins_event AS
+                INSERT INTO system_events (event_type, event_status, message, details)
+                VALUES ($1, $2, $3, $4)
+            """)
+            
             logger.info("✓ PostgreSQL connected and all tables created")
+            # Set before logging - __init__ only assigns it once this returns
+            self.db_connected = True
             self.log_system_event('database_connection', 'success', 'All tables created successfully')
+            self.conn.commit()
             return True
             
         except Exception as e:
@@ -163,158 +276,227 @@ class ResilientPipeline:
             return
             
         try:
-            self.cursor.execute("""
-                INSERT INTO system_events (event_type, event_status, message, details)
-                VALUES (%s, %s, %s, %s)
-            """, (event_type, status, message, str(details) if details else None))
-            self.conn.commit()
+            # Committed with the next batch (or at shutdown)
+            self.cursor.execute("EXECUTE ins_event (%s, %s, %s, %s)", (event_type, status, message, str(details) if details else None))
         except Exception as e:
             logger.error(f"Failed to log system event: {e}")
     
     def log_metric(self, metric_name, value, sensor_id=None, tags=None):
-        """Log metrics for Grafana dashboards"""
+        """Buffer a metric for Grafana dashboards, written by flush_metrics()"""
         if not self.db_connected:
             return
             
+        # \N is COPY's NULL
+        sensor_id = sensor_id or '\\N'
+        tags = str(tags).translate(COPY_TEXT_ESCAPES) if tags else '\\N'
+        self._metrics_buf.write(f"{metric_name}\t{value}\t{sensor_id}\t{tags}\n")
+    
+    def flush_metrics(self):
+        """COPY all buffered metrics in one statement"""
         try:
-            self.cursor.execute("""
-                INSERT INTO pipeline_metrics (metric_name, metric_value, sensor_id, tags)
-                VALUES (%s, %s, %s, %s)
-            """, (metric_name, value, sensor_id, str(tags) if tags else None))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Failed to log metric: {e}")
+            self._copy_buffer(self._metrics_buf, COPY_PIPELINE_METRICS)
+        finally:
+            self._metrics_buf.seek(0)
+            self._metrics_buf.truncate(0)
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.15  # 15% anomaly rate for more action
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
-        }
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, 0.15, now)  # 15% anomaly rate for more action
     
     def save_to_database(self, reading, prediction):
+        """Buffer a reading (and alert) for the next COPY flush"""
         if not self.db_connected:
             return False
             
+        self._readings_buf.write(
+            f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+            f"{reading['humidity']}\t{reading['actual_anomaly']}\t{prediction}\n"
+        )
+        
+        # Buffer anomaly alert if detected
+        if prediction == -1:
+            self._alerts_buf.write(
+                f"{reading['sensor_id']}\t{reading['timestamp']}\t{reading['temperature']}\t"
+                f"{reading['humidity']}\tML_DETECTED\n"
+            )
+        
+        self._buffered_readings += 1
+        return True
+    
+    def _copy_buffer(self, buf, copy_sql):
+        """Run a COPY ... FROM STDIN statement over a tab-separated buffer"""
+        if buf.tell() == 0:
+            return
+        buf.seek(0)
+        self.cursor.copy_expert(copy_sql, buf)
+    
+    def flush_to_database(self):
+        """COPY all buffered rows; committed by commit_batch()"""
         try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
-            
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
+            self._copy_buffer(self._readings_buf, COPY_SENSOR_READINGS)
+            self._copy_buffer(self._alerts_buf, COPY_ANOMALY_ALERTS)
+        finally:
+            self._buffered_readings = 0
+            for buf in (self._readings_buf, self._alerts_buf):
+                buf.seek(0)
+                buf.truncate(0)
+    
+    def commit_batch(self):
+        """Persist the batch's readings, metrics and status row in one transaction"""
+        if not self.db_connected:
+            return False
             
+        saved = self._buffered_readings
+        try:
+            self.flush_to_database()
+            self.flush_metrics()
+            self.update_pipeline_status(pending_saves=saved)
+            # Delivered on commit; wakes web_monitor's /api/stream listeners
+            self.cursor.execute("NOTIFY pipeline_batch")
             self.conn.commit()
-            self.stats['db_saves'] += 1
+            self.stats['db_saves'] += saved
             return True
             
         except Exception as e:
             logger.error(f"❌ Database save failed: {e}")
+            self.conn.rollback()
+            self._metrics_buf.seek(0)
+            self._metrics_buf.truncate(0)
             self.stats['errors'] += 1
             return False
     
     def save_to_local_files(self, reading, prediction):
-        """Save data to local files as MinIO alternative"""
+        """Queue a reading for the local bronze/silver/gold files (MinIO alternative)"""
+        data = {
+            'sensor_id': reading['sensor_id'],
+            'timestamp': reading['timestamp'],  # serialized by the writer thread
+            'temperature': reading['temperature'],
+            'humidity': reading['humidity'],
+            'ml_prediction': prediction,
+            'actual_anomaly': reading['actual_anomaly']
+        }
+        self._file_queue.put(data)
+        return True
+    
+    def current_hour_key(self):
+        """Hour bucket for file names, reformatted only when the hour rolls over"""
+        now = time.time()
+        if now >= self._hour_ends:
+            hour_start = datetime.fromtimestamp(now).replace(minute=0, second=0, microsecond=0)
+            self._hour_key = hour_start.strftime('%Y%m%d_%H')
+            self._hour_ends = (hour_start + timedelta(hours=1)).timestamp()
+        return self._hour_key
+    
+    def _layer_files(self, handles, data):
+        """Yield the open handle for each layer this record belongs in"""
+        hour_suffix = self.current_hour_key()
+        layers = [('bronze', 'sensor_data')]
+        if data['ml_prediction'] == -1:
+            # Anomaly - save to gold
+            layers.append(('gold', 'anomalies'))
+        else:
+            # Normal - save to silver
+            layers.append(('silver', 'normal_data'))
+        
+        for layer, prefix in layers:
+            current = handles.get(layer)
+            if current is None or current[0] != hour_suffix:
+                # Hour rolled over (or first write) - switch to the new file
+                if current is not None:
+                    current[1].close()
+                handle = open(f"../data/{layer}/{prefix}_{hour_suffix}.jsonl", 'ab', buffering=1 << 20)
+                current = handles[layer] = (hour_suffix, handle)
+            yield current[1]
+    
+    def _file_writer_loop(self):
+        """Append queued records, flushing every 100 records or 5 seconds"""
+        handles = {}
+        pending = 0
+        last_flush = time.monotonic()
+        
         try:
-            # Create directories
-            os.makedirs('../data/bronze', exist_ok=True)
-            os.makedirs('../data/silver', exist_ok=True)
-            os.makedirs('../data/gold', exist_ok=True)
-            
-            data = {
-                'sensor_id': reading['sensor_id'],
-                'timestamp': reading['timestamp'].isoformat(),
-                'temperature': reading['temperature'],
-                'humidity': reading['humidity'],
-                'ml_prediction': prediction,
-                'actual_anomaly': reading['actual_anomaly']
-            }
-            
-            # Save to bronze (all data)
-            bronze_file = f"../data/bronze/sensor_data_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
-            with open(bronze_file, 'a') as f:
-                f.write(json.dumps(data) + '\n')
-            
-            # Save to appropriate layer
-            if prediction == -1:
-                # Anomaly - save to gold
-                gold_file = f"../data/gold/anomalies_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
-                with open(gold_file, 'a') as f:
-                    f.write(json.dumps(data) + '\n')
-            else:
-                # Normal - save to silver
-                silver_file = f"../data/silver/normal_data_{datetime.now().strftime('%Y%m%d_%H')}.jsonl"
-                with open(silver_file, 'a') as f:
-                    f.write(json.dumps(data) + '\n')
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Local file save failed: {e}")
-            return False
+            while True:
+                try:
+                    data = self._file_queue.get(timeout=1)
+                except queue.Empty:
+                    data = False
+                
+                if data is None:
+                    break
+                
+                if data:
+                    try:
+                        line = to_json_line(data)
+                        for handle in self._layer_files(handles, data):
+                            handle.write(line)
+                        pending += 1
+                    except Exception as e:
+                        logger.error(f"Local file save failed: {e}")
+                
+                if pending and (pending >= 100 or time.monotonic() - last_flush >= 5):
+                    for _, handle in handles.values():
+                        handle.flush()
+                    pending = 0
+                    last_flush = time.monotonic()
+        finally:
+            for _, handle in handles.values():
+                handle.close()
     
-    def update_pipeline_status(self):
-        """Update overall pipeline status for monitoring"""
-        if not self.db_connected:
-            return
-            
+    def stop_file_writer(self):
+        """Flush queued records and stop the writer thread"""
+        self._file_queue.put(None)
+        self._file_writer.join(timeout=10)
+    
+    def update_pipeline_status(self, pending_saves=0):
+        """Insert the pipeline status row; committed by commit_batch()"""
+        uptime = time.monotonic() - self._start_mono
+        
+        self.cursor.execute("EXECUTE ins_status (%s, %s, %s, %s, %s, %s, %s)", (
+            self.stats['total_readings'],
+            self.stats['anomalies_detected'],
+            self.stats['db_saves'] + pending_saves,
+            self.stats['errors'],
+            int(uptime),
+            'disconnected',  # MinIO status
+            'connected' if self.db_connected else 'disconnected'
+        ))
+    
+    def start_view_refresher(self):
+        """Refresh anomaly_per_minute every 30 seconds (and roll partitions daily) on a background thread"""
+        self._refresh_stop = threading.Event()
+        threading.Thread(target=self._refresh_views, daemon=True).start()
+    
+    def _refresh_views(self):
+        # Own autocommit connection, so refreshes never share the batch transaction
         try:
-            uptime = (datetime.now() - self.stats['start_time']).total_seconds()
-            
-            self.cursor.execute("""
-                INSERT INTO pipeline_status 
-                (total_readings, anomalies_detected, db_saves, errors, uptime_seconds, minio_status, db_status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                self.stats['total_readings'],
-                self.stats['anomalies_detected'],
-                self.stats['db_saves'],
-                self.stats['errors'],
-                int(uptime),
-                'disconnected',  # MinIO status
-                'connected' if self.db_connected else 'disconnected'
-            ))
-            
-            self.conn.commit()
-            
+            conn = psycopg2.connect(**DB_PARAMS)
+            conn.autocommit = True
         except Exception as e:
-            logger.error(f"Status update failed: {e}")
+            logger.error(f"View refresher could not connect: {e}")
+            return
+        
+        try:
+            cursor = conn.cursor()
+            partitions_day = date.today()
+            while not self._refresh_stop.wait(30):
+                try:
+                    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY anomaly_per_minute")
+                except psycopg2.Error as e:
+                    logger.error(f"View refresh failed: {e}")
+                
+                # Daily retention job: next day's partition and expired drops
+                if date.today() != partitions_day:
+                    try:
+                        maintain_partitions(conn)
+                        partitions_day = date.today()
+                    except psycopg2.Error as e:
+                        logger.error(f"Partition maintenance failed: {e}")
+        finally:
+            conn.close()
     
-    def print_dashboard(self):
+    def print_dashboard(self, now):
         """Print console dashboard"""
-        uptime = datetime.now() - self.stats['start_time']
+        uptime = now - self.stats['start_time']
         anomaly_rate = (self.stats['anomalies_detected'] / self.stats['total_readings'] * 100) if self.stats['total_readings'] > 0 else 0
         
         print("\n" + "="*70)
@@ -341,19 +523,26 @@ class ResilientPipeline:
             return
         
         batch_count = 0
+        self.start_view_refresher()
+        next_tick = time.monotonic()
         
         try:
             while True:
                 batch_count += 1
-                batch_start_time = time.time()
+                batch_start_time = time.monotonic()
                 batch_anomalies = 0
                 
                 logger.info(f"🔄 Processing Batch {batch_count}")
                 
-                # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    prediction = self.detector.predict([reading])[0]
+                # Generate readings from all sensors; one timestamp for the batch
+                iter_now = datetime.now()
+                features, readings = self.generate_batch(iter_now)
+                
+                # ML prediction for the whole batch in one call
+                predictions = self.detector.predict_ndarray(features).tolist()
+                
+                for reading, prediction in zip(readings, predictions):
+                    sensor_id = reading['sensor_id']
                     
                     # Save to database and local files
                     db_success = self.save_to_database(reading, prediction)
@@ -375,16 +564,24 @@ class ResilientPipeline:
                         logger.info(f"✅ Normal: {sensor_id} - T:{reading['temperature']}°C H:{reading['humidity']}%")
                 
                 # Log batch metrics
-                batch_time = (time.time() - batch_start_time) * 1000
+                batch_time = (time.monotonic() - batch_start_time) * 1000
                 self.log_metric('batch_processing_time_ms', batch_time)
                 self.log_metric('batch_size', len(self.sensors))
                 
-                # Update status and show dashboard
-                self.update_pipeline_status()
-                self.print_dashboard()
+                # One COPY per table, one metrics INSERT and the status row,
+                # all in a single commit
+                self.commit_batch()
+                self.print_dashboard(iter_now)
                 
-                logger.info(f"⏳ Waiting 8 seconds before next batch...")
-                time.sleep(8)  # 8 second intervals
+                # 8 second intervals, measured from batch start so processing
+                # time does not push every following batch later
+                next_tick += 8.0
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                else:
+                    logger.warning(f"⏱️ Batch {batch_count} overran its 8s budget by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             logger.info("🛑 Pipeline stopped by user")
@@ -393,7 +590,11 @@ class ResilientPipeline:
             logger.error(f"💥 Pipeline crashed: {e}")
             self.log_system_event('pipeline_crash', 'failed', str(e))
         finally:
+            self._refresh_stop.set()
+            self.stop_file_writer()
             if self.db_connected and self.conn:
+                # Keep the shutdown/crash event logged above
+                self.conn.commit()
                 self.conn.close()
             logger.info("🏁 Pipeline shutdown complete")
 
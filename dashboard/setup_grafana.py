@@ -1,5 +1,4 @@
 import requests
-import json
 import time
 
 def setup_grafana():
@@ -13,18 +12,28 @@ def setup_grafana():
     print(f"URL: {grafana_url}")
     print(f"Login: {username}/{password}")
     
-    # Wait for Grafana to be ready
+    # One keep-alive session for the health probes and the API calls
+    session = requests.Session()
+    session.auth = (username, password)
+    
+    # Wait for Grafana to be ready (60 s overall, each probe capped at 1 s)
     print("Waiting for Grafana to be ready...")
-    for i in range(30):
+    deadline = time.monotonic() + 60
+    attempt = 0
+    while True:
+        attempt += 1
         try:
-            response = requests.get(f"{grafana_url}/api/health")
+            response = session.get(f"{grafana_url}/api/health", timeout=1)
             if response.status_code == 200:
                 print("Grafana is ready!")
                 break
-        except:
+        except requests.RequestException:
             pass
+        if time.monotonic() >= deadline:
+            print("Grafana did not become ready in 60s, trying setup anyway")
+            break
         time.sleep(2)
-        print(f"  Waiting... ({i+1}/30)")
+        print(f"  Waiting... (attempt {attempt})")
     
     # Create PostgreSQL data source
     datasource_config = {
@@ -43,11 +52,10 @@ def setup_grafana():
     }
     
     try:
-        response = requests.post(
+        response = session.post(
             f"{grafana_url}/api/datasources",
-            auth=(username, password),
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(datasource_config)
+            json=datasource_config,
+            timeout=10
         )
         
         if response.status_code in [200, 409]:  # 409 = already exists
@@ -57,6 +65,8 @@ def setup_grafana():
     
     except Exception as e:
         print(f"Error setting up data source: {e}")
+    finally:
+        session.close()
     
     print("\nMANUAL GRAFANA SETUP STEPS:")
     print("1. Open http://localhost:3000")
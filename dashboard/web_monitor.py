@@ -1,281 +1,329 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import json
+import atexit
+import select
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
+DB_PARAMS = {
+    'host': 'localhost',
+    'database': 'iot_analytics',
+    'user': 'postgres',
+    'password': 'postgres',
+    'port': '5432'
+}
+
+# Pipelines NOTIFY this channel in the same transaction as each batch
+BATCH_CHANNEL = 'pipeline_batch'
+# Streams re-snapshot after this many seconds without a notification
+STREAM_POLL_SECONDS = 10
+
+# Connections are reused across requests instead of reconnecting per call
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    """Create the connection pool on first use (None if the database is down)"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            try:
+                _db_pool = ThreadedConnectionPool(1, 8, **DB_PARAMS)
+                atexit.register(_db_pool.closeall)
+            except psycopg2.Error:
+                return None
+        return _db_pool
+
+@contextmanager
 def get_db_connection():
+    """Borrow a pooled connection for one request (yields None if unavailable)"""
+    pool = get_db_pool()
+    if pool is None:
+        yield None
+        return
+    
+    conn = pool.getconn()
     try:
-        return psycopg2.connect(
-            host="localhost",
-            database="iot_analytics",
-            user="postgres",
-            password="postgres",
-            port="5432"
-        )
-    except:
-        return None
+        yield conn
+    finally:
+        # End the read transaction so the connection goes back idle
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn, close=bool(conn.closed))
+
+def to_json(payload):
+    """Serialize a payload as a JSON string"""
+    if orjson:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload)
+
+def json_response(payload):
+    """jsonify(), serialized with orjson when it is installed"""
+    if orjson:
+        return Response(orjson.dumps(payload), mimetype='application/json')
+    return jsonify(payload)
+
+# Per-minute anomaly counts come from the rollup view ResilientPipeline
+# refreshes every 30 s, or from the raw alerts when the view does not exist
+# or has fallen behind them (e.g. no ResilientPipeline is running)
+ANOMALY_TIMELINE_ROLLUP = """
+    SELECT minute, count
+    FROM anomaly_per_minute
+    WHERE minute > NOW() - INTERVAL '1 hour'
+"""
+ANOMALY_TIMELINE_RAW = """
+    SELECT DATE_TRUNC('minute', timestamp) as minute, COUNT(*) as count
+    FROM anomaly_alerts
+    WHERE timestamp > NOW() - INTERVAL '1 hour'
+    GROUP BY minute
+"""
+# Fresh unless the newest recent alert is more than a minute past the view's
+# newest bucket (NULL, i.e. no recent alerts, counts as fresh); both sides
+# are index lookups
+ROLLUP_FRESH = """
+    SELECT COALESCE((SELECT MAX(minute) FROM anomaly_per_minute), '-infinity')
+        >= (SELECT DATE_TRUNC('minute', MAX(timestamp)) - INTERVAL '1 minute'
+            FROM anomaly_alerts WHERE timestamp > NOW() - INTERVAL '1 hour')
+"""
+_rollup_exists = False
+
+def anomaly_timeline_sql(cursor):
+    """Pick the timeline source: the rollup view while it exists and keeps up"""
+    global _rollup_exists
+    if not _rollup_exists:
+        cursor.execute("SELECT to_regclass('anomaly_per_minute')")
+        _rollup_exists = cursor.fetchone()[0] is not None
+        if not _rollup_exists:
+            return ANOMALY_TIMELINE_RAW
+    cursor.execute(ROLLUP_FRESH)
+    return ANOMALY_TIMELINE_RAW if cursor.fetchone()[0] is False else ANOMALY_TIMELINE_ROLLUP
 
 @app.route('/')
 def dashboard():
-    return render_template('dashboard.html')
+    # The page is static; all data arrives over /api/stream
+    response = app.make_response(render_template('dashboard.html'))
+    response.cache_control.max_age = 60
+    return response
 
 @app.route('/api/stats')
 def get_stats():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'})
-    
-    cursor = conn.cursor()
-    
-    try:
-        # Get latest pipeline stats
-        cursor.execute("""
-            SELECT total_readings, anomalies_detected, minio_uploads, db_saves, errors, uptime_seconds
-            FROM pipeline_stats 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        """)
+    with get_db_connection() as conn:
+        if not conn:
+            return jsonify({'error': 'Database connection failed'})
         
-        stats = cursor.fetchone()
+        cursor = conn.cursor()
         
-        if stats:
-            total_readings, anomalies, minio_uploads, db_saves, errors, uptime = stats
-            anomaly_rate = (anomalies / total_readings * 100) if total_readings > 0 else 0
+        try:
+            # Get latest pipeline stats
+            cursor.execute("""
+                SELECT total_readings, anomalies_detected, minio_uploads, db_saves, errors, uptime_seconds
+                FROM pipeline_stats 
+                ORDER BY timestamp DESC 
+                LIMIT 1
+            """)
             
-            return jsonify({
-                'total_readings': total_readings,
-                'anomalies_detected': anomalies,
-                'anomaly_rate': round(anomaly_rate, 1),
-                'minio_uploads': minio_uploads,
-                'db_saves': db_saves,
-                'errors': errors,
-                'uptime_hours': round(uptime / 3600, 1),
-                'status': 'running'
-            })
-        else:
-            return jsonify({'status': 'no_data'})
+            stats = cursor.fetchone()
             
-    except Exception as e:
-        return jsonify({'error': str(e)})
-    finally:
-        conn.close()
+            if stats:
+                total_readings, anomalies, minio_uploads, db_saves, errors, uptime = stats
+                anomaly_rate = (anomalies / total_readings * 100) if total_readings > 0 else 0
+                
+                return jsonify({
+                    'total_readings': total_readings,
+                    'anomalies_detected': anomalies,
+                    'anomaly_rate': round(anomaly_rate, 1),
+                    'minio_uploads': minio_uploads,
+                    'db_saves': db_saves,
+                    'errors': errors,
+                    'uptime_hours': round(uptime / 3600, 1),
+                    'status': 'running'
+                })
+            else:
+                return jsonify({'status': 'no_data'})
+                
+        except Exception as e:
+            return jsonify({'error': str(e)})
 
 @app.route('/api/recent_readings')
 def get_recent_readings():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'})
-    
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute("""
-            SELECT sensor_id, temperature, humidity, 
-                   CASE WHEN ml_prediction = -1 THEN 'ANOMALY' ELSE 'NORMAL' END as status,
-                   timestamp
-            FROM sensor_readings 
-            WHERE timestamp > NOW() - INTERVAL '10 minutes'
-            ORDER BY timestamp DESC 
-            LIMIT 50
-        """)
+    with get_db_connection() as conn:
+        if not conn:
+            return jsonify({'error': 'Database connection failed'})
         
-        readings = []
-        for row in cursor.fetchall():
-            readings.append({
-                'sensor_id': row[0],
-                'temperature': row[1],
-                'humidity': row[2],
-                'status': row[3],
-                'timestamp': row[4].strftime('%H:%M:%S')
-            })
+        cursor = conn.cursor()
         
-        return jsonify(readings)
-        
-    except Exception as e:
-        return jsonify({'error': str(e)})
-    finally:
-        conn.close()
+        try:
+            # Postgres returns the finished JSON array; ::text skips psycopg2's
+            # JSON decode so the body is passed straight through
+            cursor.execute("""
+                SELECT COALESCE(json_agg(json_build_object(
+                    'sensor_id', sensor_id,
+                    'temperature', temperature,
+                    'humidity', humidity,
+                    'status', CASE WHEN ml_prediction = -1 THEN 'ANOMALY' ELSE 'NORMAL' END,
+                    'timestamp', to_char(timestamp, 'HH24:MI:SS')
+                ) ORDER BY timestamp DESC), '[]'::json)::text
+                FROM (
+                    SELECT sensor_id, temperature, humidity, ml_prediction, timestamp
+                    FROM sensor_readings 
+                    WHERE timestamp > NOW() - INTERVAL '10 minutes'
+                    ORDER BY timestamp DESC 
+                    LIMIT 50
+                ) recent
+            """)
+            
+            return Response(cursor.fetchone()[0], mimetype='application/json')
+            
+        except Exception as e:
+            return jsonify({'error': str(e)})
 
 @app.route('/api/anomaly_timeline')
 def get_anomaly_timeline():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Database connection failed'})
-    
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute("""
-            SELECT DATE_TRUNC('minute', timestamp) as minute, COUNT(*) as count
-            FROM anomaly_alerts 
-            WHERE timestamp > NOW() - INTERVAL '1 hour'
-            GROUP BY minute
-            ORDER BY minute
-        """)
+    with get_db_connection() as conn:
+        if not conn:
+            return jsonify({'error': 'Database connection failed'})
         
-        timeline = []
-        for row in cursor.fetchall():
-            timeline.append({
-                'time': row[0].strftime('%H:%M'),
-                'count': row[1]
-            })
+        cursor = conn.cursor()
         
-        return jsonify(timeline)
-        
-    except Exception as e:
-        return jsonify({'error': str(e)})
-    finally:
-        conn.close()
+        try:
+            cursor.execute(anomaly_timeline_sql(cursor) + " ORDER BY minute")
+            
+            timeline = []
+            for row in cursor.fetchall():
+                timeline.append({
+                    'time': row[0].strftime('%H:%M'),
+                    'count': row[1]
+                })
+            
+            return jsonify(timeline)
+            
+        except Exception as e:
+            return jsonify({'error': str(e)})
 
-# Create templates directory and HTML template
-@app.before_first_request
-def create_template():
-    os.makedirs('templates', exist_ok=True)
+def fetch_dashboard_data(cursor):
+    """Stats, recent readings and anomaly timeline from one query/snapshot"""
+    # Postgres builds the whole payload, so there is no per-row Python loop
+    cursor.execute(f"""
+        WITH stats AS (
+            SELECT total_readings, anomalies_detected, minio_uploads, db_saves, errors, uptime_seconds
+            FROM pipeline_stats
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ), recent AS (
+            SELECT sensor_id, temperature, humidity, ml_prediction, timestamp
+            FROM sensor_readings
+            WHERE timestamp > NOW() - INTERVAL '10 minutes'
+            ORDER BY timestamp DESC
+            LIMIT 50
+        ), timeline AS ({anomaly_timeline_sql(cursor)})
+        SELECT json_build_object(
+            'stats', (SELECT row_to_json(stats) FROM stats),
+            'readings', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'sensor_id', sensor_id,
+                    'temperature', temperature,
+                    'humidity', humidity,
+                    'status', CASE WHEN ml_prediction = -1 THEN 'ANOMALY' ELSE 'NORMAL' END,
+                    'timestamp', to_char(timestamp, 'HH24:MI:SS')
+                ) ORDER BY timestamp DESC)
+                FROM recent
+            ), '[]'::json),
+            'timeline', COALESCE((
+                SELECT json_agg(json_build_object(
+                    'time', to_char(minute, 'HH24:MI'),
+                    'count', count
+                ) ORDER BY minute)
+                FROM timeline
+            ), '[]'::json)
+        )
+    """)
     
-    html_content = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>IoT Pipeline Monitor</title>
-    <meta http-equiv="refresh" content="10">
-    <style>
-        body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
-        .container { max-width: 1200px; margin: 0 auto; }
-        .header { background: #2c3e50; color: white; padding: 20px; border-radius: 8px; margin-bottom: 20px; }
-        .stats-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 20px; margin-bottom: 20px; }
-        .stat-card { background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-        .stat-value { font-size: 2em; font-weight: bold; color: #3498db; }
-        .stat-label { color: #7f8c8d; margin-top: 5px; }
-        .anomaly { color: #e74c3c !important; }
-        .normal { color: #27ae60 !important; }
-        .readings-table { background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-        .readings-table table { width: 100%; border-collapse: collapse; }
-        .readings-table th { background: #34495e; color: white; padding: 12px; text-align: left; }
-        .readings-table td { padding: 12px; border-bottom: 1px solid #ecf0f1; }
-        .status-indicator { padding: 4px 8px; border-radius: 4px; color: white; font-size: 0.8em; }
-        .status-normal { background: #27ae60; }
-        .status-anomaly { background: #e74c3c; }
-        .loading { text-align: center; padding: 20px; color: #7f8c8d; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🚀 IoT ML Pipeline Monitor</h1>
-            <p>Real-time monitoring dashboard for sensor data processing</p>
-        </div>
-        
-        <div class="stats-grid" id="stats-grid">
-            <div class="stat-card">
-                <div class="stat-value" id="total-readings">-</div>
-                <div class="stat-label">Total Readings</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-value anomaly" id="anomalies">-</div>
-                <div class="stat-label">Anomalies Detected</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-value" id="anomaly-rate">-</div>
-                <div class="stat-label">Anomaly Rate (%)</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-value normal" id="uptime">-</div>
-                <div class="stat-label">Uptime (hours)</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-value" id="minio-uploads">-</div>
-                <div class="stat-label">MinIO Uploads</div>
-            </div>
-            <div class="stat-card">
-                <div class="stat-value" id="errors">-</div>
-                <div class="stat-label">Errors</div>
-            </div>
-        </div>
+    data = cursor.fetchone()[0]
+    
+    # Same stats shape as /api/stats
+    stats = data['stats']
+    if stats:
+        total_readings = stats['total_readings']
+        anomalies = stats['anomalies_detected']
+        anomaly_rate = (anomalies / total_readings * 100) if total_readings > 0 else 0
         
-        <div class="readings-table">
-            <h3 style="margin: 0; padding: 20px; background: #ecf0f1;">Recent Sensor Readings</h3>
-            <table>
-                <thead>
-                    <tr>
-                        <th>Sensor ID</th>
-                        <th>Temperature (°C)</th>
-                        <th>Humidity (%)</th>
-                        <th>Status</th>
-                        <th>Time</th>
-                    </tr>
-                </thead>
-                <tbody id="readings-tbody">
-                    <tr><td colspan="5" class="loading">Loading...</td></tr>
-                </tbody>
-            </table>
-        </div>
-    </div>
-
-    <script>
-        function updateStats() {
-            fetch('/api/stats')
-                .then(response => response.json())
-                .then(data => {
-                    if (data.error) {
-                        console.error('Stats error:', data.error);
-                        return;
-                    }
-                    
-                    document.getElementById('total-readings').textContent = data.total_readings || '-';
-                    document.getElementById('anomalies').textContent = data.anomalies_detected || '-';
-                    document.getElementById('anomaly-rate').textContent = data.anomaly_rate || '-';
-                    document.getElementById('uptime').textContent = data.uptime_hours || '-';
-                    document.getElementById('minio-uploads').textContent = data.minio_uploads || '-';
-                    document.getElementById('errors').textContent = data.errors || '-';
-                })
-                .catch(error => console.error('Error fetching stats:', error));
+        data['stats'] = {
+            'total_readings': total_readings,
+            'anomalies_detected': anomalies,
+            'anomaly_rate': round(anomaly_rate, 1),
+            'minio_uploads': stats['minio_uploads'],
+            'db_saves': stats['db_saves'],
+            'errors': stats['errors'],
+            'uptime_hours': round(stats['uptime_seconds'] / 3600, 1),
+            'status': 'running'
         }
+    else:
+        data['stats'] = {'status': 'no_data'}
+    
+    return data
+
+@app.route('/api/all')
+def get_dashboard_data():
+    with get_db_connection() as conn:
+        if not conn:
+            return jsonify({'error': 'Database connection failed'})
         
-        function updateReadings() {
-            fetch('/api/recent_readings')
-                .then(response => response.json())
-                .then(data => {
-                    if (data.error) {
-                        console.error('Readings error:', data.error);
-                        return;
-                    }
-                    
-                    const tbody = document.getElementById('readings-tbody');
-                    tbody.innerHTML = '';
-                    
-                    data.forEach(reading => {
-                        const row = tbody.insertRow();
-                        row.innerHTML = `
-                            <td>${reading.sensor_id}</td>
-                            <td>${reading.temperature}</td>
-                            <td>${reading.humidity}</td>
-                            <td><span class="status-indicator status-${reading.status.toLowerCase()}">${reading.status}</span></td>
-                            <td>${reading.timestamp}</td>
-                        `;
-                    });
-                })
-                .catch(error => console.error('Error fetching readings:', error));
-        }
+        cursor = conn.cursor()
         
-        // Update every 5 seconds
-        setInterval(() => {
-            updateStats();
-            updateReadings();
-        }, 5000);
+        try:
+            return json_response(fetch_dashboard_data(cursor))
+            
+        except Exception as e:
+            return jsonify({'error': str(e)})
+
+@app.route('/api/stream')
+def stream_dashboard_data():
+    """Server-Sent Events: push the dashboard payload after each notified batch,
+    or every STREAM_POLL_SECONDS when no notification arrives"""
+    def events():
+        # A dedicated connection: it stays LISTENing for the life of the stream
+        try:
+            conn = psycopg2.connect(**DB_PARAMS)
+        except psycopg2.Error:
+            yield f"data: {to_json({'error': 'Database connection failed'})}\n\n"
+            return
         
-        // Initial load
-        updateStats();
-        updateReadings();
-    </script>
-</body>
-</html>
-    '''
+        conn.autocommit = True
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f"LISTEN {BATCH_CHANNEL}")
+            yield f"data: {to_json(fetch_dashboard_data(cursor))}\n\n"
+            
+            while True:
+                if select.select([conn], [], [], STREAM_POLL_SECONDS) == ([], [], []):
+                    # Only some pipelines NOTIFY; for the rest, re-snapshot on
+                    # a timer (this also lets the server notice a closed tab)
+                    yield f"data: {to_json(fetch_dashboard_data(cursor))}\n\n"
+                    continue
+                
+                conn.poll()
+                if conn.notifies:
+                    # Several batches may have landed; one snapshot covers them all
+                    conn.notifies.clear()
+                    yield f"data: {to_json(fetch_dashboard_data(cursor))}\n\n"
+                    
+        except Exception as e:
+            yield f"data: {to_json({'error': str(e)})}\n\n"
+        finally:
+            conn.close()
     
-    with open('templates/dashboard.html', 'w') as f:
-        f.write(html_content)
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -2,57 +2,86 @@ import sys
 import os
 import time
 import json
-import psycopg2
+import io
+import queue
+import threading
 import boto3
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-import random
 from botocore.client import Config
 
-# Add ml-models to path
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml-models'))
-from anomaly_detector import AnomalyDetector
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-class WorkingPipeline:
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# pipeline_base lives at the repo root
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline_base import BasePipeline
+
+# Only bodies this large go through parallel multipart upload; parts stay
+# >= 64 MiB so even multi-GiB objects need few parts
+MULTIPART_TRANSFER = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024,
+    multipart_chunksize=64 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+# Concurrent per-bucket uploads (one PUT per bucket per batch)
+UPLOAD_WORKERS = 3
+# Most scored batches the writer thread coalesces into one flush
+WRITE_COALESCE = 10
+
+def to_json_line(data):
+    """Serialize a record as one newline-terminated JSON line (bytes)"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, default=datetime.isoformat) + '\n').encode()
+
+def to_parquet(records):
+    """Encode records as Snappy Parquet bytes: float32 readings, dictionary-encoded sensor_id"""
+    table = pa.table({
+        'sensor_id': pa.array([r['sensor_id'] for r in records], pa.string()).dictionary_encode(),
+        'timestamp': pa.array([r['timestamp'] for r in records], pa.timestamp('us')),
+        'temperature': pa.array([r['temperature'] for r in records], pa.float32()),
+        'humidity': pa.array([r['humidity'] for r in records], pa.float32()),
+        'ml_prediction': pa.array([r['ml_prediction'] for r in records], pa.int8()),
+        'actual_anomaly': pa.array([r['actual_anomaly'] for r in records], pa.bool_())
+    })
+    buf = pa.BufferOutputStream()
+    pq.write_table(table, buf, compression='snappy')
+    return buf.getvalue().to_pybytes()
+
+class WorkingPipeline(BasePipeline):
+    MODEL_PATH = '../ml-models/anomaly_model.pkl'
+    ANOMALY_RATE = 0.15  # 15% anomaly rate for more action
+    
     def __init__(self):
-        self.detector = AnomalyDetector()
-        self.load_model()
-        self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        super().__init__()
+        # At most one PUT per bucket per batch, so one worker per bucket;
+        # finish_uploads() waits at batch end
+        self.upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+        self._pending_uploads = []
+        # This batch's JSON lines per bucket, uploaded as one object each
+        self._minio_lines = {'bronze': [], 'silver': [], 'gold': []}
+        # With pyarrow, silver/gold records are kept for one Parquet object each instead
+        self._minio_records = {'silver': [], 'gold': []}
+        # Per-bucket key prefixes, reformatted only when the batch hour changes
+        self._key_hour = None
+        self._key_prefixes = {}
         self.setup_database()
         self.setup_minio()
-        
-    def load_model(self):
-        try:
-            self.detector.load_model('../ml-models/anomaly_model.pkl')
-            print("SUCCESS: ML model loaded")
-        except:
-            print("Training new model...")
-            self.train_model()
-    
-    def train_model(self):
-        training_data = self.generate_training_data(1000)
-        self.detector.train(training_data)
-        self.detector.save_model('../ml-models/anomaly_model.pkl')
-        print("SUCCESS: Model trained and saved")
-    
-    def generate_training_data(self, num_samples):
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        # Scored batches for the writer thread; None asks it to stop
+        self.write_q = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._writer_loop, name='pipeline-writer', daemon=True)
+        self.writer.start()
     
     def setup_minio(self):
         try:
@@ -61,7 +90,17 @@ class WorkingPipeline:
                 endpoint_url='http://localhost:9000',
                 aws_access_key_id='minioadmin',
                 aws_secret_access_key='minioadmin',
-                config=Config(signature_version='s3v4'),
+                # The client is thread-safe and reused across batches; its
+                # kept-alive pooled connections skip the TCP handshake on
+                # every PUT. Sized so every upload worker can run a full
+                # multipart transfer without the pool discarding sockets
+                config=Config(
+                    signature_version='s3v4',
+                    max_pool_connections=UPLOAD_WORKERS * MULTIPART_TRANSFER.max_concurrency,
+                    tcp_keepalive=True,
+                    retries={'mode': 'standard', 'max_attempts': 3},
+                    s3={'addressing_style': 'path'}
+                ),
                 region_name='us-east-1'
             )
             
@@ -75,150 +114,133 @@ class WorkingPipeline:
     
     def setup_database(self):
         try:
-            self.conn = psycopg2.connect(
-                host="localhost",
-                database="iot_analytics",
-                user="postgres",
-                password="postgres",
-                port="5432"
-            )
-            self.cursor = self.conn.cursor()
-            
-            # Create tables
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sensor_readings (
-                    id SERIAL PRIMARY KEY,
-                    sensor_id VARCHAR(50),
-                    timestamp TIMESTAMP,
-                    temperature FLOAT,
-                    humidity FLOAT,
-                    is_anomaly BOOLEAN,
-                    ml_prediction INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS anomaly_alerts (
-                    id SERIAL PRIMARY KEY,
-                    sensor_id VARCHAR(50),
-                    timestamp TIMESTAMP,
-                    temperature FLOAT,
-                    humidity FLOAT,
-                    alert_type VARCHAR(50),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            self.conn.commit()
+            super().setup_database()
             print("SUCCESS: Database setup complete")
             
         except Exception as e:
             print(f"Database connection failed: {e}")
             self.conn = None
     
-    def generate_sensor_reading(self, sensor_id):
-        is_anomaly = random.random() < 0.15  # 15% anomaly rate for more action
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
+    def _upload(self, bucket, key, body, content_type='application/x-ndjson'):
+        """Upload one object (runs on the upload pool)"""
+        if len(body) >= MULTIPART_TRANSFER.multipart_threshold:
+            return self.s3_client.upload_fileobj(
+                io.BytesIO(body), bucket, key,
+                ExtraArgs={'ContentType': content_type},
+                Config=MULTIPART_TRANSFER
+            )
+        return self.s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=body,
+            ContentType=content_type
+        )
+    
+    def _upload_parquet(self, bucket, key, records):
+        """Encode and upload one Parquet object (runs on the upload pool)"""
+        return self._upload(bucket, key, to_parquet(records), 'application/vnd.apache.parquet')
+    
+    def save_to_minio(self, reading, prediction):
+        """Queue a reading for this batch's bronze and silver/gold objects"""
+        if not self.s3_client:
+            return
             
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly
+        data = {
+            'sensor_id': reading['sensor_id'],
+            'timestamp': reading['timestamp'],
+            'temperature': reading['temperature'],
+            'humidity': reading['humidity'],
+            'ml_prediction': prediction,
+            'actual_anomaly': reading['actual_anomaly']
         }
+        line = to_json_line(data)
+        
+        # Bronze gets everything, then silver or gold based on prediction
+        self._minio_lines['bronze'].append(line)
+        bucket = 'gold' if prediction == -1 else 'silver'
+        if pa:
+            self._minio_records[bucket].append(data)
+        else:
+            self._minio_lines[bucket].append(line)
     
-    def save_to_minio(self, reading, prediction):
+    def start_uploads(self, batch_now):
+        """Upload each bucket's buffered readings as one JSONL (or Parquet) object"""
         if not self.s3_client:
             return
             
-        try:
-            data = {
-                'sensor_id': reading['sensor_id'],
-                'timestamp': reading['timestamp'].isoformat(),
-                'temperature': reading['temperature'],
-                'humidity': reading['humidity'],
-                'ml_prediction': prediction,
-                'actual_anomaly': reading['actual_anomaly']
+        key_hour = (batch_now.date(), batch_now.hour)
+        if key_hour != self._key_hour:
+            date_prefix = batch_now.strftime('%Y/%m/%d')
+            hour_prefix = f"{date_prefix}/{batch_now.hour:02d}"
+            self._key_prefixes = {
+                'bronze': f"raw_data/{hour_prefix}/",
+                'silver': f"processed_data/{hour_prefix}/",
+                'gold': f"anomalies/{date_prefix}/"
             }
-            
-            # Save to bronze bucket (raw data)
-            bronze_key = f"raw_data/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d/%H')}/{int(time.time())}.json"
-            self.s3_client.put_object(
-                Bucket='bronze',
-                Key=bronze_key,
-                Body=json.dumps(data),
-                ContentType='application/json'
-            )
-            
-            # Save to appropriate bucket based on prediction
-            if prediction == -1:
-                # Anomaly - save to gold bucket
-                gold_key = f"anomalies/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d')}/{int(time.time())}.json"
-                self.s3_client.put_object(
-                    Bucket='gold',
-                    Key=gold_key,
-                    Body=json.dumps(data),
-                    ContentType='application/json'
-                )
-                print(f"  -> Saved anomaly to MinIO: gold/{gold_key}")
-            else:
-                # Normal - save to silver bucket
-                silver_key = f"processed_data/{reading['sensor_id']}/{datetime.now().strftime('%Y/%m/%d/%H')}/{int(time.time())}.json"
-                self.s3_client.put_object(
-                    Bucket='silver',
-                    Key=silver_key,
-                    Body=json.dumps(data),
-                    ContentType='application/json'
-                )
-            
-        except Exception as e:
-            print(f"MinIO save error: {e}")
+            self._key_hour = key_hour
+        batch_ts = int(batch_now.timestamp())
+        
+        for bucket, lines in self._minio_lines.items():
+            if lines:
+                key = f"{self._key_prefixes[bucket]}{batch_ts}.jsonl"
+                future = self.upload_pool.submit(self._upload, bucket, key, b''.join(lines))
+                self._pending_uploads.append((future, bucket, key))
+                lines.clear()
+        
+        for bucket, records in self._minio_records.items():
+            if records:
+                key = f"{self._key_prefixes[bucket]}batch_{batch_ts}.parquet"
+                future = self.upload_pool.submit(self._upload_parquet, bucket, key, records.copy())
+                self._pending_uploads.append((future, bucket, key))
+                records.clear()
     
-    def save_to_database(self, reading, prediction):
-        if not self.conn:
+    def finish_uploads(self):
+        """Wait for the batch's uploads and report the outcome"""
+        if not self._pending_uploads:
             return
             
-        try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
-            
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
-            
-            self.conn.commit()
+        wait([future for future, _, _ in self._pending_uploads])
+        for future, bucket, key in self._pending_uploads:
+            error = future.exception()
+            if error:
+                print(f"MinIO save error: {error}")
+            elif bucket == 'gold':
+                print(f"  -> Saved anomalies to MinIO: gold/{key}")
+        self._pending_uploads.clear()
+    
+    def _writer_loop(self):
+        """Write scored batches to MinIO and PostgreSQL off the main loop"""
+        stopping = False
+        while not stopping:
+            batches = [self.write_q.get()]
+            # Catch up on anything that queued behind a slow flush
+            while len(batches) < WRITE_COALESCE and not self.write_q.empty():
+                batches.append(self.write_q.get())
+            if None in batches:
+                stopping = True
+                batches = batches[:batches.index(None)]
+            if not batches:
+                continue
             
-        except Exception as e:
-            print(f"Database save error: {e}")
+            try:
+                for _, readings, predictions in batches:
+                    for reading, prediction in zip(readings, predictions):
+                        self.save_to_minio(reading, prediction)
+                        self.save_to_database(reading, prediction)
+                
+                # One object per bucket (keyed by the latest batch); the
+                # database write runs while the uploads are in flight
+                self.start_uploads(batches[-1][0])
+                self.flush_to_database()
+                self.finish_uploads()
+            except Exception as e:
+                print(f"Batch write error: {e}")
+            finally:
+                # A failed batch must not leak into the next flush
+                self._reading_rows.clear()
+                self._alert_rows.clear()
+                for buffered in (*self._minio_lines.values(), *self._minio_records.values()):
+                    buffered.clear()
     
     def run_pipeline(self):
         print("Starting Working IoT Pipeline")
@@ -229,22 +251,23 @@ class WorkingPipeline:
         
         reading_count = 0
         anomaly_count = 0
+        # Batches start on fixed 10s beats; I/O time doesn't push the schedule back
+        next_tick = time.monotonic()
         
         try:
             while True:
                 print(f"\n--- Processing Batch {reading_count//5 + 1} ---")
                 
-                # Generate readings from all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    
-                    # ML prediction
-                    prediction = self.detector.predict([reading])[0]
-                    
-                    # Save to MinIO and database
-                    self.save_to_minio(reading, prediction)
-                    self.save_to_database(reading, prediction)
-                    
+                # One clock read per batch: reading timestamps and object keys
+                batch_now = datetime.now()
+                
+                # Generate readings from all sensors, with one ML prediction call
+                readings, predictions = self.score_batch(batch_now)
+                
+                # MinIO and database writes happen on the writer thread
+                self.write_q.put((batch_now, readings, predictions))
+                
+                for reading, prediction in zip(readings, predictions):
                     reading_count += 1
                     
                     if prediction == -1:
@@ -256,12 +279,22 @@ class WorkingPipeline:
                 print(f"Total: {reading_count} readings, {anomaly_count} anomalies ({anomaly_count/reading_count*100:.1f}%)")
                 print("Check MinIO console to see new files!")
                 
-                time.sleep(10)  # 10 second intervals
+                next_tick += 10.0  # 10 second intervals
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+                else:
+                    print(f"Batch overran its 10s interval by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             print(f"\nPipeline stopped.")
             print(f"Final stats: {reading_count} readings, {anomaly_count} anomalies")
         finally:
+            # Let the writer drain what's queued before closing its resources
+            self.write_q.put(None)
+            self.writer.join()
+            self.upload_pool.shutdown()
             if self.conn:
                 self.conn.close()
 
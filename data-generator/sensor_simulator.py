@@ -4,15 +4,32 @@ import random
 from datetime import datetime
 from kafka import KafkaProducer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def serialize(value):
+    """Kafka message value as UTF-8 JSON bytes"""
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value).encode('utf-8')
+
 class IoTSensorSimulator:
     def __init__(self, kafka_bootstrap_servers='localhost:9092'):
         self.producer = KafkaProducer(
             bootstrap_servers=kafka_bootstrap_servers,
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
+            value_serializer=serialize,
+            # Let sends accumulate for up to 100 ms into 64 KB lz4-compressed
+            # batches instead of one small request per reading
+            linger_ms=100,
+            batch_size=65536,
+            compression_type='lz4',
+            acks=1
         )
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
         
-    def generate_sensor_data(self, sensor_id):
+    def generate_sensor_data(self, sensor_id, timestamp):
         # Simulate normal vs anomaly patterns
         is_anomaly = random.random() < 0.05  # 5% anomaly rate
         
@@ -25,7 +42,7 @@ class IoTSensorSimulator:
             
         return {
             'sensor_id': sensor_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': timestamp,
             'temperature': round(temperature, 2),
             'humidity': round(humidity, 2),
             'is_anomaly': is_anomaly
@@ -35,8 +52,10 @@ class IoTSensorSimulator:
         print(f"Starting IoT sensor simulation to topic: {topic}")
         try:
             while True:
+                # One timestamp per round, shared by all sensors
+                timestamp = datetime.now().isoformat()
                 for sensor_id in self.sensors:
-                    data = self.generate_sensor_data(sensor_id)
+                    data = self.generate_sensor_data(sensor_id, timestamp)
                     self.producer.send(topic, data)
                     print(f"Sent: {data}")
                 time.sleep(interval)
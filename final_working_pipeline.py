@@ -2,101 +2,59 @@ import sys
 import os
 import time
 import json
-import psycopg2
 from datetime import datetime
-import random
 
-# Add ml-models to path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'ml-models'))
-from anomaly_detector import AnomalyDetector
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-class FinalWorkingPipeline:
+# pipeline_base sits next to this file
+sys.path.append(os.path.dirname(__file__))
+from pipeline_base import BasePipeline
+
+def to_json_line(data):
+    """Serialize a record as one newline-terminated JSON line (bytes); datetimes become ISO 8601"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, default=datetime.isoformat) + '\n').encode()
+
+class FinalWorkingPipeline(BasePipeline):
+    # Higher anomaly rate for more interesting demo
+    ANOMALY_RATE = 0.25  # 25% anomaly rate
+    # Per-bucket hourly ndjson files: (directory, file name prefix)
+    FILE_LAYERS = {
+        'bronze': ('minio_data/bronze/raw_data', 'sensor_data'),
+        'silver': ('minio_data/silver/processed_data', 'normal_data'),
+        'gold': ('minio_data/gold/anomalies', 'anomalies')
+    }
+    
     def __init__(self):
         print("=== IoT ML PIPELINE STARTING ===")
         
-        self.detector = AnomalyDetector()
-        self.load_model()
-        self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        super().__init__()
+        # This batch's JSON lines per bucket, appended by flush_files()
+        self._file_lines = {bucket: [] for bucket in self.FILE_LAYERS}
+        # bucket -> (hour key, open append handle); rotated on the hour
+        self._file_handles = {}
         self.setup_database()
         self.setup_file_storage()
         
         self.stats = {
             'total_readings': 0,
             'anomalies_detected': 0,
-            'files_created': 0,
+            'records_written': 0,
             'start_time': datetime.now()
         }
         
-    def load_model(self):
-        try:
-            self.detector.load_model('ml-models/anomaly_model.pkl')
-            print("SUCCESS: ML model loaded")
-        except Exception as e:
-            print(f"Training new model...")
-            self.train_model()
-    
     def train_model(self):
         print("Training ML model...")
-        training_data = []
-        for i in range(1000):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            training_data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        
-        self.detector.train(training_data)
-        self.detector.save_model('ml-models/anomaly_model.pkl')
-        print("SUCCESS: Model trained and saved")
+        super().train_model()
     
     def setup_database(self):
         print("Connecting to PostgreSQL for Grafana...")
         try:
-            self.conn = psycopg2.connect(
-                host="localhost",
-                database="iot_analytics", 
-                user="postgres",
-                password="postgres",
-                port="5432"
-            )
-            self.cursor = self.conn.cursor()
-            
-            # Create tables for Grafana dashboards
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sensor_readings (
-                    id SERIAL PRIMARY KEY,
-                    sensor_id VARCHAR(50),
-                    timestamp TIMESTAMP,
-                    temperature FLOAT,
-                    humidity FLOAT,
-                    is_anomaly BOOLEAN,
-                    ml_prediction INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS anomaly_alerts (
-                    id SERIAL PRIMARY KEY,
-                    sensor_id VARCHAR(50),
-                    timestamp TIMESTAMP,
-                    temperature FLOAT,
-                    humidity FLOAT,
-                    alert_type VARCHAR(50),
-                    severity VARCHAR(20),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            super().setup_database()
             
             # Clean old data for fresh demo
             self.cursor.execute("DELETE FROM sensor_readings WHERE created_at < NOW() - INTERVAL '2 hours'")
@@ -114,117 +72,78 @@ class FinalWorkingPipeline:
         print("Setting up file storage for MinIO...")
         
         # Create directory structure
-        directories = [
-            'minio_data/bronze/raw_data',
-            'minio_data/silver/processed_data', 
-            'minio_data/gold/anomalies'
-        ]
-        
-        for directory in directories:
+        for directory, _ in self.FILE_LAYERS.values():
             os.makedirs(directory, exist_ok=True)
         
         print("SUCCESS: File storage ready for MinIO upload")
     
-    def generate_sensor_reading(self, sensor_id):
-        # Higher anomaly rate for more interesting demo
-        is_anomaly = random.random() < 0.25  # 25% anomaly rate
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-            severity = 'HIGH' if temperature > 100 else 'MEDIUM'
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-            severity = 'LOW'
-            
-        return {
-            'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'actual_anomaly': is_anomaly,
-            'severity': severity
-        }
+    def generate_batch(self, now):
+        """Base batch plus a severity grade per reading"""
+        features, readings = super().generate_batch(now)
+        for reading in readings:
+            if reading['actual_anomaly']:
+                reading['severity'] = 'HIGH' if reading['temperature'] > 100 else 'MEDIUM'
+            else:
+                reading['severity'] = 'LOW'
+        return features, readings
     
-    def save_to_database(self, reading, prediction):
-        """Save to PostgreSQL for Grafana visualization"""
-        try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
-            
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type, severity)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED',
-                    reading['severity']
-                ))
-            
-            self.conn.commit()
-            return True
-            
-        except Exception as e:
-            print(f"Database save error: {e}")
-            return False
+    def alert_severity(self, reading):
+        return reading['severity']
     
     def save_to_files(self, reading, prediction):
-        """Save to files for manual MinIO upload"""
+        """Queue a reading for the bronze and silver/gold files; written by flush_files()"""
+        data = {
+            'sensor_id': reading['sensor_id'],
+            'timestamp': reading['timestamp'],
+            'temperature': reading['temperature'],
+            'humidity': reading['humidity'],
+            'ml_prediction': prediction,
+            'actual_anomaly': reading['actual_anomaly'],
+            'severity': reading['severity'],
+            'processing_time': datetime.now()
+        }
+        # Serialized once, queued for both layers
+        line = to_json_line(data)
+        
+        # Bronze gets everything, then silver or gold based on prediction
+        self._file_lines['bronze'].append(line)
+        if prediction == -1:
+            self._file_lines['gold'].append(line)
+        else:
+            self._file_lines['silver'].append(line)
+    
+    def flush_files(self, batch_now):
+        """Append the batch to each bucket's hourly ndjson file (for manual MinIO upload)"""
+        hour_key = batch_now.strftime('%Y%m%d_%H')
         try:
-            timestamp_str = reading['timestamp'].strftime('%Y%m%d_%H%M%S')
+            for bucket, lines in self._file_lines.items():
+                if not lines:
+                    continue
+                current = self._file_handles.get(bucket)
+                if current is None or current[0] != hour_key:
+                    # Hour rolled over (or first write) - switch to the new file
+                    if current is not None:
+                        current[1].close()
+                    directory, prefix = self.FILE_LAYERS[bucket]
+                    handle = open(f"{directory}/{prefix}_{hour_key}.ndjson", 'ab', buffering=1 << 20)
+                    current = self._file_handles[bucket] = (hour_key, handle)
+                current[1].write(b''.join(lines))
+                current[1].flush()
             
-            data = {
-                'sensor_id': reading['sensor_id'],
-                'timestamp': reading['timestamp'].isoformat(),
-                'temperature': reading['temperature'],
-                'humidity': reading['humidity'],
-                'ml_prediction': prediction,
-                'actual_anomaly': reading['actual_anomaly'],
-                'severity': reading['severity'],
-                'processing_time': datetime.now().isoformat()
-            }
-            
-            # Save to bronze (all data)
-            bronze_file = f"minio_data/bronze/raw_data/{reading['sensor_id']}_{timestamp_str}.json"
-            with open(bronze_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            
-            # Save to appropriate layer based on prediction
-            if prediction == -1:
-                # Anomaly - save to gold
-                gold_file = f"minio_data/gold/anomalies/anomaly_{reading['sensor_id']}_{timestamp_str}.json"
-                with open(gold_file, 'w') as f:
-                    json.dump(data, f, indent=2)
-            else:
-                # Normal - save to silver
-                silver_file = f"minio_data/silver/processed_data/normal_{reading['sensor_id']}_{timestamp_str}.json"
-                with open(silver_file, 'w') as f:
-                    json.dump(data, f, indent=2)
-            
-            self.stats['files_created'] += 1
+            self.stats['records_written'] += len(self._file_lines['bronze'])
             return True
             
         except Exception as e:
             print(f"File save error: {e}")
             return False
+        finally:
+            for lines in self._file_lines.values():
+                lines.clear()
+    
+    def close_files(self):
+        for _, handle in self._file_handles.values():
+            handle.close()
+        self._file_handles.clear()
     
     def print_status(self):
         uptime = datetime.now() - self.stats['start_time']
@@ -236,7 +155,7 @@ class FinalWorkingPipeline:
         print(f"Uptime: {uptime}")
         print(f"Total Readings: {self.stats['total_readings']}")
         print(f"Anomalies Detected: {self.stats['anomalies_detected']} ({anomaly_rate:.1f}%)")
-        print(f"Files Created: {self.stats['files_created']}")
+        print(f"File Records Written: {self.stats['records_written']}")
         print(f"")
         print(f"DASHBOARDS & INTERFACES:")
         print(f"  Grafana Dashboard: http://localhost:3000")
@@ -260,18 +179,24 @@ class FinalWorkingPipeline:
         print("=" * 50)
         
         batch_count = 0
+        # Batches start on fixed 12s beats; I/O time doesn't push the schedule back
+        next_tick = time.monotonic()
         
         try:
             while True:
                 batch_count += 1
                 batch_anomalies = 0
                 
-                print(f"\nProcessing Batch {batch_count} at {datetime.now().strftime('%H:%M:%S')}")
+                # One clock read per batch for timestamps, file names and the log line
+                batch_now = datetime.now()
+                
+                print(f"\nProcessing Batch {batch_count} at {batch_now:%H:%M:%S}")
                 
-                # Process all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    prediction = self.detector.predict([reading])[0]
+                # Process all sensors, with one ML prediction call
+                readings, predictions = self.score_batch(batch_now)
+                
+                for reading, prediction in zip(readings, predictions):
+                    sensor_id = reading['sensor_id']
                     
                     # Save to database and files
                     self.save_to_database(reading, prediction)
@@ -286,14 +211,24 @@ class FinalWorkingPipeline:
                     else:
                         print(f"  Normal:  {sensor_id} - T:{reading['temperature']}C H:{reading['humidity']}%")
                 
+                # One round-trip and commit for the whole batch, one append per file
+                self.flush_to_database()
+                self.flush_files(batch_now)
+                
                 print(f"\nBatch {batch_count} Complete: {len(self.sensors)} readings, {batch_anomalies} anomalies")
                 
                 # Show status every 3 batches
                 if batch_count % 3 == 0:
                     self.print_status()
                 
-                print("Waiting 12 seconds for next batch...")
-                time.sleep(12)
+                next_tick += 12.0
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for > 0:
+                    print(f"Waiting {sleep_for:.1f} seconds for next batch...")
+                    time.sleep(sleep_for)
+                else:
+                    print(f"Batch {batch_count} overran its 12s interval by {-sleep_for:.2f}s")
+                    next_tick = time.monotonic()
                 
         except KeyboardInterrupt:
             print("\n\nPipeline stopped by user")
@@ -305,6 +240,7 @@ class FinalWorkingPipeline:
             print("   - minio_data/silver/ -> silver bucket") 
             print("   - minio_data/gold/ -> gold bucket")
         finally:
+            self.close_files()
             if self.conn:
                 self.conn.close()
             print("Pipeline shutdown complete")
@@ -2,10 +2,27 @@ import boto3
 import requests
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from botocore.client import Config
 from botocore.exceptions import ClientError, EndpointConnectionError
 
+# Probes fail fast instead of waiting on default TCP timeouts and retries
+PROBE_TIMEOUTS = {'connect_timeout': 2, 'read_timeout': 3, 'retries': {'max_attempts': 1}}
+
+def probe_s3_config(endpoint, config_dict):
+    """Create a client for one endpoint/config pair and list buckets with it"""
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=endpoint,
+        aws_access_key_id='minioadmin',
+        aws_secret_access_key='minioadmin',
+        region_name='us-east-1',
+        config=Config(**config_dict, **PROBE_TIMEOUTS)
+    )
+    response = s3_client.list_buckets()
+    return s3_client, [b['Name'] for b in response['Buckets']]
+
 def test_minio_detailed():
     print("=== DETAILED MinIO CONNECTION TEST ===")
     
@@ -41,23 +58,21 @@ def test_minio_detailed():
     
     print("\n3. Testing S3 Client Configurations...")
     
-    for i, endpoint in enumerate(endpoints):
-        for j, config_dict in enumerate(configs):
+    # All endpoint/config pairs are probed at once; the first to answer wins
+    combos = [(endpoint, j, config_dict) for endpoint in endpoints for j, config_dict in enumerate(configs)]
+    executor = ThreadPoolExecutor(max_workers=len(combos))
+    futures = {
+        executor.submit(probe_s3_config, endpoint, config_dict): (endpoint, j, config_dict)
+        for endpoint, j, config_dict in combos
+    }
+    
+    try:
+        for future in as_completed(futures):
+            endpoint, j, config_dict = futures[future]
+            print(f"\n   Tested {endpoint} with config {j+1}...")
+            
             try:
-                print(f"\n   Testing {endpoint} with config {j+1}...")
-                
-                s3_client = boto3.client(
-                    's3',
-                    endpoint_url=endpoint,
-                    aws_access_key_id='minioadmin',
-                    aws_secret_access_key='minioadmin',
-                    region_name='us-east-1',
-                    config=Config(**config_dict)
-                )
-                
-                # Try to list buckets
-                response = s3_client.list_buckets()
-                buckets = [b['Name'] for b in response['Buckets']]
+                s3_client, buckets = future.result()
                 print(f"   ✓ SUCCESS! Found buckets: {buckets}")
                 
                 # Try to upload a test file
@@ -84,6 +99,9 @@ def test_minio_detailed():
                 print(f"   ✗ Client error: {e}")
             except Exception as e:
                 print(f"   ✗ Other error: {e}")
+    finally:
+        # Don't wait for the probes still in flight
+        executor.shutdown(wait=False, cancel_futures=True)
     
     print("\n❌ All S3 configurations failed!")
     return None, None, None
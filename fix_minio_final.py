@@ -13,23 +13,10 @@ def fix_minio_connection():
         time.sleep(10)
         
         print("3. Testing connection...")
-        import boto3
-        from botocore.client import Config
+        from minio_client import s3
         
-        # Try with updated configuration
-        s3_client = boto3.client(
-            's3',
-            endpoint_url='http://localhost:9000',
-            aws_access_key_id='minioadmin',
-            aws_secret_access_key='minioadmin',
-            region_name='us-east-1',
-            config=Config(
-                signature_version='s3v4',
-                retries={'max_attempts': 3},
-                read_timeout=60,
-                connect_timeout=60
-            )
-        )
+        # Shared client: retries, keep-alive and path-style addressing
+        s3_client = s3()
         
         buckets = s3_client.list_buckets()
         print(f"   SUCCESS: Connected! Buckets: {[b['Name'] for b in buckets['Buckets']]}")
@@ -1,19 +1,40 @@
 import sys
 import os
 import time
-import json
+import signal
+import threading
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
 import random
+import numpy as np
 
 # Add ml-models to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ml-models'))
 from anomaly_detector import AnomalyDetector
 
+# Per-reading trace goes to a rotating log file through a queue (the
+# writing thread never blocks on disk); stdout only gets batch summaries
+os.makedirs('logs', exist_ok=True)
+_log_queue = queue.Queue(-1)
+log_listener = QueueListener(_log_queue, RotatingFileHandler(
+    'logs/local_demo.log', maxBytes=10 * 1024 * 1024, backupCount=3, encoding='utf-8', delay=True
+))
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[QueueHandler(_log_queue)]
+)
+logger = logging.getLogger(__name__)
+
 class LocalIoTPipelineDemo:
     def __init__(self):
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        # Set by SIGTERM; the demo's waits return as soon as it is
+        self.stop_event = threading.Event()
         
     def load_model(self):
         """Load the trained model"""
@@ -32,28 +53,15 @@ class LocalIoTPipelineDemo:
         print("SUCCESS: New model trained and saved")
     
     def generate_training_data(self, num_samples):
-        """Generate synthetic training data"""
-        data = []
-        for i in range(num_samples):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
-        return data
+        """Training set as an (N, 2) temperature/humidity array for detector.train()"""
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples))
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples))
+        return np.column_stack((temperature, humidity)).round(2)
     
-    def generate_sensor_reading(self, sensor_id):
-        """Generate a single sensor reading"""
+    def generate_sensor_reading(self, sensor_id, now):
+        """Generate a single sensor reading stamped with the cycle's clock read"""
         is_anomaly = random.random() < 0.05  # 5% anomaly rate
         
         if is_anomaly:
@@ -65,7 +73,7 @@ class LocalIoTPipelineDemo:
             
         return {
             'sensor_id': sensor_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now,
             'temperature': round(temperature, 2),
             'humidity': round(humidity, 2),
             'actual_anomaly': is_anomaly
@@ -76,31 +84,31 @@ class LocalIoTPipelineDemo:
         if not readings:
             return
             
-        print(f"\n--- Processing batch of {len(readings)} readings ---")
-        
         # ML prediction
         predictions = self.detector.predict(readings)
         
         normal_count = 0
         anomaly_count = 0
+        correct_count = 0
         
         for i, reading in enumerate(readings):
             prediction = predictions[i]
             actual = reading['actual_anomaly']
             
             status = "ANOMALY" if prediction == -1 else "NORMAL"
-            accuracy = "CORRECT" if (prediction == -1) == actual else "WRONG"
+            correct = (prediction == -1) == actual
+            correct_count += correct
             
-            print(f"{reading['sensor_id']}: T={reading['temperature']}°C, H={reading['humidity']}% -> {status} {accuracy}")
+            logger.debug(f"{reading['sensor_id']}: T={reading['temperature']}°C, H={reading['humidity']}% -> {status} {'CORRECT' if correct else 'WRONG'}")
             
             if prediction == -1:
                 anomaly_count += 1
                 # Simulate saving to "gold" bucket
-                print(f"  ALERT: Anomaly detected in {reading['sensor_id']}!")
+                logger.warning(f"ALERT: Anomaly detected in {reading['sensor_id']}!")
             else:
                 normal_count += 1
         
-        print(f"Summary: {normal_count} normal, {anomaly_count} anomalies detected")
+        print(f"Batch of {len(readings)}: {normal_count} normal, {anomaly_count} anomalies detected, {correct_count} correct (details: logs/local_demo.log)")
         return normal_count, anomaly_count
     
     def run_demo(self, duration_seconds=60, batch_size=5):
@@ -113,12 +121,15 @@ class LocalIoTPipelineDemo:
         batch_readings = []
         total_normal = 0
         total_anomalies = 0
+        signal.signal(signal.SIGTERM, lambda *_: self.stop_event.set())
+        log_listener.start()
         
         try:
-            while time.time() - start_time < duration_seconds:
-                # Generate readings from all sensors
+            while not self.stop_event.is_set() and time.time() - start_time < duration_seconds:
+                # Generate readings from all sensors, one timestamp per cycle
+                cycle_now = datetime.now()
                 for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
+                    reading = self.generate_sensor_reading(sensor_id, cycle_now)
                     batch_readings.append(reading)
                 
                 # Process batch when it reaches the desired size
@@ -128,7 +139,7 @@ class LocalIoTPipelineDemo:
                     total_anomalies += anomalies
                     batch_readings = []
                 
-                time.sleep(2)  # Wait 2 seconds between sensor cycles
+                self.stop_event.wait(2)  # Wait 2 seconds between sensor cycles
                 
         except KeyboardInterrupt:
             print("\nDemo stopped by user")
@@ -138,6 +149,8 @@ class LocalIoTPipelineDemo:
             normal, anomalies = self.process_batch(batch_readings)
             total_normal += normal
             total_anomalies += anomalies
+        # Flushes the queued trace lines to the log file
+        log_listener.stop()
         
         print("\n" + "=" * 50)
         print(f"FINAL RESULTS:")
@@ -0,0 +1,32 @@
+import boto3
+from botocore.client import Config
+
+MINIO_ENDPOINT = 'http://localhost:9000'
+
+# One session per process: credentials and region are resolved once, and
+# botocore's endpoint/service model loading is paid by the first client only
+_session = boto3.session.Session(
+    aws_access_key_id='minioadmin',
+    aws_secret_access_key='minioadmin',
+    region_name='us-east-1'
+)
+_S3 = None
+
+def s3():
+    """Shared MinIO S3 client, created on first use and reused afterwards"""
+    global _S3
+    if _S3 is None:
+        _S3 = _session.client(
+            's3',
+            endpoint_url=MINIO_ENDPOINT,
+            config=Config(
+                signature_version='s3v4',
+                # Kept-alive pooled connections: later calls skip the TCP handshake
+                max_pool_connections=50,
+                tcp_keepalive=True,
+                retries={'max_attempts': 3, 'mode': 'adaptive'},
+                # MinIO buckets aren't DNS names; skip virtual-host probing
+                s3={'addressing_style': 'path'}
+            )
+        )
+    return _S3
@@ -1,4 +1,4 @@
-import pickle
+import joblib
 import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
@@ -14,39 +14,76 @@ class AnomalyDetector:
         features = self.extract_features(data)
         scaled_features = self.scaler.fit_transform(features)
         self.model.fit(scaled_features)
+        self.cache_scaling()
         self.is_trained = True
         print(f"Model trained on {len(data)} samples")
     
     def predict(self, data):
-        """Predict anomalies in new data"""
+        """Predict anomalies in new data (records or an (N, 2) temperature/humidity array)"""
         if not self.is_trained:
             return [0] * len(data)  # Return normal if not trained
             
+        if isinstance(data, np.ndarray):
+            return self.predict_ndarray(data).tolist()
+            
         features = self.extract_features(data)
-        scaled_features = self.scaler.transform(features)
-        predictions = self.model.predict(scaled_features)
-        return [-1 if p == -1 else 0 for p in predictions]  # -1 = anomaly, 0 = normal
+        return self.predict_features(features).tolist()  # -1 = anomaly, 0 = normal
+    
+    def predict_ndarray(self, data):
+        """Predict on an (N, 2) temperature/humidity array, returning an int8 array of -1/0"""
+        if not self.is_trained:
+            return np.zeros(len(data), dtype=np.int8)
+            
+        features = self.extract_array_features(data)
+        return self.predict_features(features)
+    
+    def predict_features(self, features):
+        """Score extracted features (scaled in place) as an int8 array of -1/0"""
+        predictions = self.model.predict(self.scale_in_place(features))
+        # The forest returns -1/+1: map +1 to 0 without a Python-level loop
+        return np.where(predictions == -1, -1, 0).astype(np.int8)
+    
+    def cache_scaling(self):
+        """Precompute the fitted scaler's parameters in the features' float32"""
+        self._mean = self.scaler.mean_.astype(np.float32)
+        self._inv_scale = (1.0 / self.scaler.scale_).astype(np.float32)
+    
+    def scale_in_place(self, features):
+        """StandardScaler.transform, overwriting the fresh feature buffer instead of allocating"""
+        features -= self._mean
+        features *= self._inv_scale
+        return features
     
     def extract_features(self, data):
         """Extract features from sensor data"""
-        features = []
-        for record in data:
-            features.append([
-                record['temperature'],
-                record['humidity'],
-                record['temperature'] / record['humidity'] if record['humidity'] > 0 else 0
-            ])
-        return np.array(features)
+        if isinstance(data, np.ndarray):
+            return self.extract_array_features(data)
+            
+        # Columns pulled once, then the same in-place ratio as the array path
+        features = np.zeros((len(data), 3), dtype=np.float32)
+        features[:, 0] = np.fromiter((record['temperature'] for record in data), dtype=np.float32, count=len(data))
+        features[:, 1] = np.fromiter((record['humidity'] for record in data), dtype=np.float32, count=len(data))
+        np.divide(features[:, 0], features[:, 1], out=features[:, 2], where=features[:, 1] > 0)
+        return features
+    
+    def extract_array_features(self, data):
+        """Extract features from an (N, 2) array of temperature, humidity columns"""
+        # Filled in place: one C-order (N, 3) allocation instead of per-column
+        # temporaries. Sensor readings carry 2 decimals, so float32 (what the
+        # forest scores in anyway) loses nothing and halves the bytes moved
+        features = np.zeros((len(data), 3), dtype=np.float32)
+        features[:, :2] = data
+        np.divide(data[:, 0], data[:, 1], out=features[:, 2], where=data[:, 1] > 0)
+        return features
     
     def save_model(self, path):
-        """Save trained model"""
-        with open(path, 'wb') as f:
-            pickle.dump({'model': self.model, 'scaler': self.scaler}, f)
+        """Save trained model (uncompressed so load_model can memory-map it)"""
+        joblib.dump({'model': self.model, 'scaler': self.scaler}, path, compress=0)
     
     def load_model(self, path):
-        """Load trained model"""
-        with open(path, 'rb') as f:
-            saved = pickle.load(f)
-            self.model = saved['model']
-            self.scaler = saved['scaler']
-            self.is_trained = True
\ No newline at end of file
+        """Load trained model, memory-mapping its arrays read-only"""
+        saved = joblib.load(path, mmap_mode='r')
+        self.model = saved['model']
+        self.scaler = saved['scaler']
+        self.cache_scaling()
+        self.is_trained = True
\ No newline at end of file
@@ -0,0 +1,223 @@
+import sys
+import os
+import io
+import psycopg2
+from datetime import datetime
+import numpy as np
+
+# Add ml-models to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'ml-models'))
+from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+
+def copy_value(value):
+    """Format one field for COPY ... FROM STDIN text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def generate_sensor_batch(rng, sensors, feat_buf, rate, now):
+    """One reading per sensor, a fraction `rate` of them anomalous, as
+    (features, reading dicts). features is feat_buf, an (N, 2) float32
+    temperature/humidity block overwritten in place, so it is only valid
+    until the next call."""
+    n = len(sensors)
+    is_anomaly = rng.random(n) < rate
+    temperature = np.where(is_anomaly, rng.uniform(80, 120, n), rng.uniform(18, 28, n)).round(2)
+    humidity = np.where(is_anomaly, rng.uniform(0, 20, n), rng.uniform(40, 70, n)).round(2)
+
+    feat_buf[:, 0] = temperature
+    feat_buf[:, 1] = humidity
+
+    # Dicts are only built for the storage sinks
+    readings = [
+        {
+            'sensor_id': sensor_id,
+            'timestamp': now,
+            'temperature': temp,
+            'humidity': hum,
+            'actual_anomaly': anomaly
+        }
+        for sensor_id, temp, hum, anomaly in zip(
+            sensors, temperature.tolist(), humidity.tolist(), is_anomaly.tolist()
+        )
+    ]
+    return feat_buf, readings
+
+class BasePipeline:
+    """Model, sensor generation and PostgreSQL writes shared by WorkingPipeline
+    and FinalWorkingPipeline; subclasses add their storage layer and run loop"""
+    MODEL_PATH = 'ml-models/anomaly_model.pkl'
+    ANOMALY_RATE = 0.15
+    # Batches at least this large are loaded with COPY instead of INSERT
+    COPY_THRESHOLD = 32
+
+    def __init__(self):
+        self.detector = AnomalyDetector()
+        self.load_model()
+        self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
+        # Reused every batch: (N, 2) temperature/humidity block for the detector
+        self._feat_buf = np.empty((len(self.sensors), 2), dtype=np.float32)
+        # Rows queued by save_to_database(), written by flush_to_database()
+        self._reading_rows = []
+        self._alert_rows = []
+        self.conn = None
+
+    def load_model(self):
+        try:
+            self.detector.load_model(self.MODEL_PATH)
+            print("SUCCESS: ML model loaded")
+        except Exception:
+            print("Training new model...")
+            self.train_model()
+
+    def train_model(self):
+        training_data = self.generate_training_data(1000)
+        self.detector.train(training_data)
+        self.detector.save_model(self.MODEL_PATH)
+        print("SUCCESS: Model trained and saved")
+
+    def generate_training_data(self, num_samples):
+        """Training set as an (N, 2) temperature/humidity array for detector.train()"""
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(num_samples) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples))
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples))
+        return np.column_stack((temperature, humidity)).round(2)
+
+    def setup_database(self):
+        """Connect, create the tables and prepare ins_alert; raises on failure"""
+        self.conn = psycopg2.connect(
+            host="localhost",
+            database="iot_analytics",
+            user="postgres",
+            password="postgres",
+            port="5432",
+            # Reading commits skip the WAL fsync wait; a crash can only
+            # lose the last few hundred ms of them
+            options="-c synchronous_commit=off"
+        )
+        self.cursor = self.conn.cursor()
+
+        # Create tables
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sensor_readings (
+                id SERIAL PRIMARY KEY,
+                sensor_id VARCHAR(50),
+                timestamp TIMESTAMP,
+                temperature FLOAT,
+                humidity FLOAT,
+                is_anomaly BOOLEAN,
+                ml_prediction INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS anomaly_alerts (
+                id SERIAL PRIMARY KEY,
+                sensor_id VARCHAR(50),
+                timestamp TIMESTAMP,
+                temperature FLOAT,
+                humidity FLOAT,
+                alert_type VARCHAR(50),
+                severity VARCHAR(20),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Tables created before the severity column existed
+        self.cursor.execute("ALTER TABLE anomaly_alerts ADD COLUMN IF NOT EXISTS severity VARCHAR(20)")
+
+        # Alerts are sparse (a row or two per batch): parse and plan once
+        self.cursor.execute("""
+            PREPARE ins_alert AS
+            INSERT INTO anomaly_alerts
+            (sensor_id, timestamp, temperature, humidity, alert_type, severity)
+            VALUES ($1, $2, $3, $4, $5, $6)
+        """)
+
+        # DEFAULT/daily partitions and retention, if the tables are partitioned
+        maintain_partitions(self.conn)
+        self.conn.commit()
+
+    def generate_batch(self, now):
+        """Generate one reading per sensor as (float32 features, reading dicts)"""
+        return generate_sensor_batch(self.rng, self.sensors, self._feat_buf, self.ANOMALY_RATE, now)
+
+    def score_batch(self, now):
+        """Generate a batch and run the detector on it in one call"""
+        features, readings = self.generate_batch(now)
+        return readings, self.detector.predict_ndarray(features).tolist()
+
+    def alert_severity(self, reading):
+        """Severity stored with an ML alert (None: column left empty)"""
+        return None
+
+    def save_to_database(self, reading, prediction):
+        """Queue a reading (and alert) for the batch's flush_to_database()"""
+        if not self.conn:
+            return
+
+        row = (reading['sensor_id'], reading['timestamp'], reading['temperature'], reading['humidity'])
+        self._reading_rows.append(row + (reading['actual_anomaly'], prediction))
+
+        # Queue anomaly alert if detected
+        if prediction == -1:
+            self._alert_rows.append(row + ('ML_DETECTED', self.alert_severity(reading)))
+
+    def flush_to_database(self):
+        """Write the batch's readings and alerts with one commit"""
+        if not self.conn or not self._reading_rows:
+            return True
+
+        try:
+            statements = []
+            if self._alert_rows:
+                # Anomaly alerts must be durable - wait for the fsync on this batch
+                statements.append(b"SET LOCAL synchronous_commit = on")
+
+            if len(self._reading_rows) >= self.COPY_THRESHOLD:
+                self.copy_readings()
+            else:
+                mogrify = self.cursor.mogrify
+                values = b', '.join(mogrify("(%s, %s, %s, %s, %s, %s)", row) for row in self._reading_rows)
+                statements.append(
+                    b"INSERT INTO sensor_readings "
+                    b"(sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction) "
+                    b"VALUES " + values
+                )
+
+            statements.extend(
+                self.cursor.mogrify("EXECUTE ins_alert (%s, %s, %s, %s, %s, %s)", row)
+                for row in self._alert_rows
+            )
+
+            if statements:
+                # The whole batch (bar a COPY) is one multi-statement round-trip
+                self.cursor.execute(b'; '.join(statements))
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            print(f"Database save error: {e}")
+            self.conn.rollback()
+            return False
+        finally:
+            self._reading_rows.clear()
+            self._alert_rows.clear()
+
+    def copy_readings(self):
+        """Stream the queued readings into sensor_readings with COPY (no per-row parse/bind)"""
+        buf = io.StringIO()
+        for row in self._reading_rows:
+            buf.write('\t'.join(map(copy_value, row)) + '\n')
+        buf.seek(0)
+        self.cursor.copy_expert(
+            "COPY sensor_readings (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction) FROM STDIN",
+            buf
+        )
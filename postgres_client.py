@@ -0,0 +1,127 @@
+import logging
+from contextlib import contextmanager
+from datetime import date, timedelta
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+POSTGRES_DSN = dict(
+    host="localhost",
+    database="iot_analytics",
+    user="postgres",
+    password="postgres",
+    port="5432"
+)
+
+# One pool per process: connections (auth, backend startup) are opened once
+# and handed between callers instead of per test or per run
+_POOL = None
+
+def pool():
+    """Shared PostgreSQL connection pool, created on first use"""
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadedConnectionPool(minconn=2, maxconn=10, **POSTGRES_DSN)
+    return _POOL
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; rolled back if the caller left a transaction open"""
+    conn = pool().getconn()
+    try:
+        yield conn
+    finally:
+        if not conn.closed and not conn.autocommit:
+            conn.rollback()
+        pool().putconn(conn)
+
+# Shared high-volume tables that may be split into daily partitions
+# (<table>_YYYYMMDD, plus <table>_default for anything outside them);
+# daily partitions older than RETENTION_DAYS are dropped for every writer
+PARTITIONED_TABLES = ('sensor_readings', 'anomaly_alerts', 'pipeline_metrics')
+UNLOGGED_PARTITIONS = ('pipeline_metrics',)
+RETENTION_DAYS = 7
+
+def maintain_partitions(conn):
+    """Partition upkeep that every pipeline runs at setup: make sure each
+    partitioned table has its DEFAULT and yesterday's to tomorrow's daily
+    partitions, and drop expired days. Plain (unpartitioned) tables, e.g.
+    created by an older version, are left alone. Runs in one transaction,
+    the caller's unless conn is in autocommit mode."""
+    today = date.today()
+    cursor = conn.cursor()
+    if conn.autocommit:
+        cursor.execute("BEGIN")
+    try:
+        # Pipelines started together would otherwise race on the same DDL
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('maintain_partitions'))")
+        cursor.execute("""
+            SELECT relname, relkind FROM pg_class
+            WHERE relname = ANY(%s) AND relkind IN ('r', 'p') AND pg_table_is_visible(oid)
+        """, (list(PARTITIONED_TABLES),))
+        kinds = dict(cursor.fetchall())
+        parents = [table for table in PARTITIONED_TABLES if kinds.get(table) == 'p']
+        plain = [table for table in PARTITIONED_TABLES if kinds.get(table) == 'r']
+        if parents and plain:
+            # Created unpartitioned by an older version or another pipeline;
+            # they keep working, just without daily partitions or retention
+            logger.warning(f"Not partitioned, no retention applied: {', '.join(plain)}")
+        
+        for parent in parents:
+            cursor.execute("""
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = %s::regclass
+            """, (parent,))
+            existing = {row[0] for row in cursor.fetchall()}
+            unlogged = 'UNLOGGED ' if parent in UNLOGGED_PARTITIONS else ''
+            default = f"{parent}_default"
+            
+            # Catches rows no daily partition covers, so inserts never fail
+            # when nobody has run this for a while
+            if default not in existing:
+                cursor.execute(f"CREATE {unlogged}TABLE IF NOT EXISTS {default} PARTITION OF {parent} DEFAULT")
+            
+            # Yesterday too: CURRENT_TIMESTAMP defaults follow the server's
+            # time zone, which may lag the pipeline's local date
+            for offset in (-1, 0, 1):
+                day = today + timedelta(days=offset)
+                name = f"{parent}_{day:%Y%m%d}"
+                if name not in existing:
+                    # Built detached, filled with that day's rows from the
+                    # default partition, then attached (a plain PARTITION OF
+                    # fails while the default holds rows in its range)
+                    cursor.execute(f"CREATE {unlogged}TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)")
+                    cursor.execute(f"""
+                        WITH moved AS (
+                            DELETE FROM {default}
+                            WHERE timestamp >= %s AND timestamp < %s
+                            RETURNING *
+                        )
+                        INSERT INTO {name} SELECT * FROM moved
+                    """, (day, day + timedelta(days=1)))
+                    cursor.execute(f"""
+                        ALTER TABLE {parent} ATTACH PARTITION {name}
+                        FOR VALUES FROM ('{day}') TO ('{day + timedelta(days=1)}')
+                    """)
+            
+            # Dropping a whole day is O(1), unlike DELETE + VACUUM
+            cutoff_day = today - timedelta(days=RETENTION_DAYS)
+            cutoff = f"{parent}_{cutoff_day:%Y%m%d}"
+            for name in sorted(existing):
+                if name[len(parent) + 1:].isdigit() and name < cutoff:
+                    cursor.execute(f"DROP TABLE IF EXISTS {name}")
+                    logger.info(f"Dropped expired partition {name} (older than {RETENTION_DAYS} days)")
+            cursor.execute(f"DELETE FROM {default} WHERE timestamp < %s", (cutoff_day,))
+            if cursor.rowcount > 0:
+                logger.info(f"Deleted {cursor.rowcount} expired rows from {default}")
+        
+        if conn.autocommit:
+            cursor.execute("COMMIT")
+    except Exception:
+        if conn.autocommit:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.close()
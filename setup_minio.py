@@ -1,15 +1,9 @@
-import boto3
 from botocore.exceptions import ClientError
+from minio_client import s3
 
 def setup_minio_buckets():
-    # MinIO client configuration
-    s3_client = boto3.client(
-        's3',
-        endpoint_url='http://localhost:9000',
-        aws_access_key_id='minioadmin',
-        aws_secret_access_key='minioadmin',
-        region_name='us-east-1'
-    )
+    # Shared MinIO client (see minio_client.py)
+    s3_client = s3()
     
     buckets = ['bronze', 'silver', 'gold']
     
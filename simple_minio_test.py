@@ -5,6 +5,17 @@ import time
 from datetime import datetime
 from botocore.client import Config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def to_json(data):
+    """Indented JSON document as bytes; datetimes become ISO 8601"""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY)
+    return (json.dumps(data, indent=2, default=datetime.isoformat) + '\n').encode()
+
 def test_minio_simple():
     print("=== SIMPLE MinIO TEST ===")
     
@@ -56,14 +67,14 @@ def test_minio_simple():
             # Test upload
             test_data = {
                 'test': 'upload_successful',
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': datetime.now(),
                 'config_used': i+1
             }
             
             s3_client.put_object(
                 Bucket='bronze',
                 Key=f'test_uploads/success_{int(time.time())}.json',
-                Body=json.dumps(test_data, indent=2),
+                Body=to_json(test_data),
                 ContentType='application/json'
             )
             
@@ -85,17 +96,18 @@ def create_manual_upload_files():
     os.makedirs('minio_manual_upload', exist_ok=True)
     
     # Create sample data files
+    now = datetime.now()
     sample_data = {
         'bronze_sample.json': {
             'sensor_id': 'sensor_001',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now,
             'temperature': 24.5,
             'humidity': 65.2,
             'data_type': 'raw_sensor_reading'
         },
         'silver_sample.json': {
             'sensor_id': 'sensor_001', 
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now,
             'temperature': 24.5,
             'humidity': 65.2,
             'ml_prediction': 0,
@@ -103,7 +115,7 @@ def create_manual_upload_files():
         },
         'gold_sample.json': {
             'sensor_id': 'sensor_002',
-            'timestamp': datetime.now().isoformat(), 
+            'timestamp': now, 
             'temperature': 95.8,
             'humidity': 12.1,
             'ml_prediction': -1,
@@ -113,8 +125,8 @@ def create_manual_upload_files():
     
     for filename, data in sample_data.items():
         filepath = f'minio_manual_upload/{filename}'
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(to_json(data))
         print(f"   Created: {filepath}")
     
     print("\n   MANUAL UPLOAD INSTRUCTIONS:")
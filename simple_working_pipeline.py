@@ -1,14 +1,70 @@
 import sys
 import os
 import time
-import json
+import signal
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import threading
 import psycopg2
+from psycopg2.extras import execute_batch
 from datetime import datetime
 import random
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 # Add ml-models to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ml-models'))
 from anomaly_detector import AnomalyDetector
+from postgres_client import maintain_partitions
+
+# Per-reading trace goes to a rotating log file through a queue (the
+# writing thread never blocks on disk); stdout only gets batch summaries
+os.makedirs('logs', exist_ok=True)
+_log_queue = queue.Queue(-1)
+log_listener = QueueListener(_log_queue, RotatingFileHandler(
+    'logs/simple_pipeline.log', maxBytes=10 * 1024 * 1024, backupCount=3, encoding='utf-8', delay=True
+))
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[QueueHandler(_log_queue)]
+)
+logger = logging.getLogger(__name__)
+
+# Seconds between generated batches
+BATCH_INTERVAL = 10.0
+# Seconds a stage waits on a queue before re-checking its neighbours
+QUEUE_POLL = 0.5
+
+# Column buffers behind the local files, in file/schema order
+FILE_COLUMNS = ('sensor_id', 'timestamp', 'temperature', 'humidity', 'ml_prediction', 'actual_anomaly')
+# One JSON line per reading, filled straight from the columns (sensor ids
+# are plain ASCII; floats use repr, as json.dumps does)
+JSON_LINE = (
+    '{{"sensor_id": "{}", "timestamp": "{}", "temperature": {!r}, '
+    '"humidity": {!r}, "ml_prediction": {}, "actual_anomaly": {}}}\n'
+).format
+
+# Bronze Parquet layout (with pyarrow): dictionary sensor_id, native
+# timestamps, float32 readings; one file per BRONZE_PARQUET_ROWS readings,
+# or sooner once the oldest buffered batch is BRONZE_PARQUET_MAX_AGE
+# seconds old or the hour rolls over (and at shutdown)
+BRONZE_SCHEMA = pa.schema([
+    ('sensor_id', pa.dictionary(pa.int16(), pa.string())),
+    ('timestamp', pa.timestamp('us')),
+    ('temperature', pa.float32()),
+    ('humidity', pa.float32()),
+    ('ml_prediction', pa.int8()),
+    ('actual_anomaly', pa.bool_())
+]) if pa else None
+BRONZE_PARQUET_ROWS = 1000
+BRONZE_PARQUET_MAX_AGE = 60
 
 class SimpleWorkingPipeline:
     def __init__(self):
@@ -17,6 +73,20 @@ class SimpleWorkingPipeline:
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        # Rows queued by save_to_database(), written by flush_to_database()
+        self._reading_rows = []
+        self._alert_rows = []
+        # Batch columns queued by save_to_minio_manually(), written by flush_files()
+        self._file_columns = {name: [] for name in FILE_COLUMNS}
+        # Bronze columns accumulated for the next Parquet file (with pyarrow)
+        self._bronze_columns = {name: [] for name in FILE_COLUMNS} if pa else None
+        self._bronze_started = None
+        for layer in ('bronze', 'silver', 'gold'):
+            os.makedirs(f'data/{layer}', exist_ok=True)
+        # Stage hand-offs: generator -> predictor -> IO sink; None shuts a stage down
+        self.q_ml = queue.Queue(maxsize=4)
+        self.q_io = queue.Queue(maxsize=8)
+        self._stop = threading.Event()
         self.setup_database()
         
         self.stats = {
@@ -35,23 +105,12 @@ class SimpleWorkingPipeline:
     
     def train_model(self):
         print("Training ML model...")
-        training_data = []
-        for i in range(1000):
-            is_anomaly = random.random() < 0.1
-            if is_anomaly:
-                temperature = random.uniform(80, 120)
-                humidity = random.uniform(0, 20)
-            else:
-                temperature = random.uniform(18, 28)
-                humidity = random.uniform(40, 70)
-            
-            training_data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
+        # (N, 2) temperature/humidity array; detector.train() takes it directly
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(1000) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, 1000), rng.uniform(18, 28, 1000))
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, 1000), rng.uniform(40, 70, 1000))
+        training_data = np.column_stack((temperature, humidity)).round(2)
         
         self.detector.train(training_data)
         self.detector.save_model('ml-models/anomaly_model.pkl')
@@ -99,6 +158,22 @@ class SimpleWorkingPipeline:
             self.cursor.execute("DELETE FROM sensor_readings WHERE created_at < NOW() - INTERVAL '1 hour'")
             self.cursor.execute("DELETE FROM anomaly_alerts WHERE created_at < NOW() - INTERVAL '1 hour'")
             
+            # Parsed and planned once for the session; batches only EXECUTE
+            self.cursor.execute("""
+                PREPARE ins_reading (varchar, timestamp, float, float, boolean, integer) AS
+                INSERT INTO sensor_readings 
+                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
+                VALUES ($1, $2, $3, $4, $5, $6)
+            """)
+            self.cursor.execute("""
+                PREPARE ins_alert (varchar, timestamp, float, float, varchar) AS
+                INSERT INTO anomaly_alerts 
+                (sensor_id, timestamp, temperature, humidity, alert_type)
+                VALUES ($1, $2, $3, $4, $5)
+            """)
+            
+            # DEFAULT/daily partitions and retention, if the tables are partitioned
+            maintain_partitions(self.conn)
             self.conn.commit()
             print("SUCCESS: Database connected and ready")
             
@@ -106,7 +181,7 @@ class SimpleWorkingPipeline:
             print(f"ERROR: Database connection failed: {e}")
             exit(1)
     
-    def generate_sensor_reading(self, sensor_id):
+    def generate_sensor_reading(self, sensor_id, now):
         is_anomaly = random.random() < 0.2  # 20% anomaly rate for more action
         
         if is_anomaly:
@@ -118,82 +193,117 @@ class SimpleWorkingPipeline:
             
         return {
             'sensor_id': sensor_id,
-            'timestamp': datetime.now(),
+            'timestamp': now,
             'temperature': round(temperature, 2),
             'humidity': round(humidity, 2),
             'actual_anomaly': is_anomaly
         }
     
     def save_to_database(self, reading, prediction):
+        """Queue a reading (and alert) for the batch's flush_to_database()"""
+        row = (reading['sensor_id'], reading['timestamp'], reading['temperature'], reading['humidity'])
+        self._reading_rows.append(row + (reading['actual_anomaly'], prediction))
+        
+        # Queue anomaly alert if detected
+        if prediction == -1:
+            self._alert_rows.append(row + ('ML_DETECTED',))
+        return True
+    
+    def flush_to_database(self):
+        """Write the batch's readings and alerts with one commit"""
+        if not self._reading_rows:
+            return True
+            
         try:
-            # Save sensor reading
-            self.cursor.execute("""
-                INSERT INTO sensor_readings 
-                (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                reading['sensor_id'],
-                reading['timestamp'],
-                reading['temperature'],
-                reading['humidity'],
-                reading['actual_anomaly'],
-                prediction
-            ))
+            # Each table's EXECUTEs go out in one round-trip
+            execute_batch(self.cursor, "EXECUTE ins_reading (%s, %s, %s, %s, %s, %s)", self._reading_rows, page_size=100)
             
-            # Save anomaly alert if detected
-            if prediction == -1:
-                self.cursor.execute("""
-                    INSERT INTO anomaly_alerts 
-                    (sensor_id, timestamp, temperature, humidity, alert_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (
-                    reading['sensor_id'],
-                    reading['timestamp'],
-                    reading['temperature'],
-                    reading['humidity'],
-                    'ML_DETECTED'
-                ))
+            if self._alert_rows:
+                execute_batch(self.cursor, "EXECUTE ins_alert (%s, %s, %s, %s, %s)", self._alert_rows, page_size=100)
             
             self.conn.commit()
             return True
             
         except Exception as e:
             print(f"Database save error: {e}")
+            self.conn.rollback()
             return False
+        finally:
+            self._reading_rows.clear()
+            self._alert_rows.clear()
     
     def save_to_minio_manually(self, reading, prediction):
-        """Save to local files that you can manually upload to MinIO"""
-        try:
-            os.makedirs('data/bronze', exist_ok=True)
-            os.makedirs('data/silver', exist_ok=True)
-            os.makedirs('data/gold', exist_ok=True)
-            
-            data = {
-                'sensor_id': reading['sensor_id'],
-                'timestamp': reading['timestamp'].isoformat(),
-                'temperature': reading['temperature'],
-                'humidity': reading['humidity'],
-                'ml_prediction': prediction,
-                'actual_anomaly': reading['actual_anomaly']
-            }
+        """Queue a reading for the local files you can manually upload to MinIO"""
+        columns = self._file_columns
+        columns['sensor_id'].append(reading['sensor_id'])
+        columns['timestamp'].append(reading['timestamp'])
+        columns['temperature'].append(reading['temperature'])
+        columns['humidity'].append(reading['humidity'])
+        columns['ml_prediction'].append(prediction)
+        columns['actual_anomaly'].append(reading['actual_anomaly'])
+        return True
+    
+    def flush_files(self, batch_now):
+        """Append the batch to the hourly JSONL file of each layer"""
+        columns = self._file_columns
+        if not columns['sensor_id']:
+            return True
             
-            # Save to bronze (all data)
-            with open(f"data/bronze/sensor_data_{datetime.now().strftime('%Y%m%d_%H%M')}.json", 'w') as f:
-                json.dump(data, f)
+        try:
+            hour_suffix = batch_now.strftime('%Y%m%d_%H')
+            # Timestamps are formatted once each, at the serialization boundary
+            lines = [
+                JSON_LINE(sensor_id, timestamp.isoformat(), temp, hum, pred, 'true' if actual else 'false')
+                for sensor_id, timestamp, temp, hum, pred, actual in zip(*columns.values())
+            ]
+            anomalies = [line for pred, line in zip(columns['ml_prediction'], lines) if pred == -1]
+            normal = [line for pred, line in zip(columns['ml_prediction'], lines) if pred != -1]
             
-            # Save to appropriate layer
-            if prediction == -1:
-                with open(f"data/gold/anomaly_{reading['sensor_id']}_{int(time.time())}.json", 'w') as f:
-                    json.dump(data, f)
+            # Bronze gets everything, then silver or gold based on prediction
+            layers = [
+                (f"data/silver/normal_{hour_suffix}.jsonl", normal),
+                (f"data/gold/anomalies_{hour_suffix}.jsonl", anomalies)
+            ]
+            if pa:
+                # A file never spans two hours
+                if self._bronze_started and self._bronze_started.hour != batch_now.hour:
+                    self.flush_bronze_parquet(self._bronze_started)
+                if self._bronze_started is None:
+                    self._bronze_started = batch_now
+                for name, column in columns.items():
+                    self._bronze_columns[name].extend(column)
+                if (len(self._bronze_columns['sensor_id']) >= BRONZE_PARQUET_ROWS
+                        or (batch_now - self._bronze_started).total_seconds() >= BRONZE_PARQUET_MAX_AGE):
+                    self.flush_bronze_parquet(batch_now)
             else:
-                with open(f"data/silver/normal_{reading['sensor_id']}_{int(time.time())}.json", 'w') as f:
-                    json.dump(data, f)
+                layers.append((f"data/bronze/sensor_data_{hour_suffix}.jsonl", lines))
             
+            for path, layer_lines in layers:
+                if layer_lines:
+                    with open(path, 'a') as f:
+                        f.write(''.join(layer_lines))
             return True
             
         except Exception as e:
             print(f"File save error: {e}")
             return False
+        finally:
+            for column in columns.values():
+                column.clear()
+    
+    def flush_bronze_parquet(self, batch_now):
+        """Write the accumulated bronze readings as one Zstd Parquet file"""
+        if not pa or not self._bronze_columns['sensor_id']:
+            return
+            
+        table = pa.Table.from_pydict(self._bronze_columns, schema=BRONZE_SCHEMA)
+        pq.write_table(
+            table, f"data/bronze/sensor_data_{batch_now:%Y%m%d_%H%M%S}.parquet",
+            compression='zstd', compression_level=3
+        )
+        for column in self._bronze_columns.values():
+            column.clear()
+        self._bronze_started = None
     
     def print_status(self):
         uptime = datetime.now() - self.stats['start_time']
@@ -207,6 +317,122 @@ class SimpleWorkingPipeline:
         print(f"MinIO Console: http://localhost:9001")
         print("----------------------")
     
+    def _put(self, q, item, consumer):
+        """Queue an item for the next stage; gives up (False) once that stage
+        has died instead of blocking forever on a full queue"""
+        while True:
+            try:
+                q.put(item, timeout=QUEUE_POLL)
+                return True
+            except queue.Full:
+                if not consumer.is_alive():
+                    self._stop.set()
+                    return False
+    
+    def _get(self, q, producer):
+        """Next item from the previous stage; None (shut down) once that stage
+        is gone and its queue is drained, even if its sentinel never came"""
+        while True:
+            try:
+                return q.get(timeout=QUEUE_POLL)
+            except queue.Empty:
+                if not producer.is_alive() and q.empty():
+                    self._stop.set()
+                    return None
+    
+    def _generator_loop(self):
+        """Produce one batch of readings per interval until stopped"""
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                # One clock read per batch: reading timestamps and hourly file names
+                batch_now = datetime.now()
+                readings = [self.generate_sensor_reading(sensor_id, batch_now) for sensor_id in self.sensors]
+            except Exception as e:
+                logger.error(f"Generator error: {e}")
+            else:
+                if not self._put(self.q_ml, (batch_now, readings), self._stages['predictor']):
+                    return
+            
+            next_tick += BATCH_INTERVAL
+            sleep_for = next_tick - time.monotonic()
+            if sleep_for <= 0:
+                next_tick = time.monotonic()
+            elif self._stop.wait(sleep_for):
+                break
+        self._put(self.q_ml, None, self._stages['predictor'])
+    
+    def _predictor_loop(self):
+        """Score each batch with one ML prediction call"""
+        while True:
+            batch = self._get(self.q_ml, self._stages['generator'])
+            if batch is None:
+                self._put(self.q_io, None, self._stages['io-sink'])
+                break
+            batch_now, readings = batch
+            try:
+                predictions = self.detector.predict(readings)
+            except Exception as e:
+                # Skip this batch; the stage keeps running
+                logger.error(f"Prediction error, batch of {len(readings)} readings dropped: {e}")
+                print(f"Prediction error: {e}")
+                continue
+            if not self._put(self.q_io, (batch_now, readings, predictions), self._stages['io-sink']):
+                break
+    
+    def _sink_loop(self):
+        """Write scored batches to PostgreSQL and the local files"""
+        batch_count = 0
+        while True:
+            batch = self._get(self.q_io, self._stages['predictor'])
+            if batch is None:
+                # Don't leave a partial bronze file's readings behind
+                try:
+                    self.flush_bronze_parquet(datetime.now())
+                except Exception as e:
+                    print(f"File save error: {e}")
+                break
+            try:
+                batch_count += 1
+                self.write_batch(batch_count, *batch)
+            except Exception as e:
+                logger.error(f"Sink error on batch {batch_count}: {e}")
+                print(f"Sink error: {e}")
+                # Nothing half-written carries over into the next batch
+                self._reading_rows.clear()
+                self._alert_rows.clear()
+                for column in self._file_columns.values():
+                    column.clear()
+    
+    def write_batch(self, batch_count, batch_now, readings, predictions):
+        """Save one scored batch to the database and files and report it"""
+        batch_anomalies = 0
+        
+        for reading, prediction in zip(readings, predictions):
+            sensor_id = reading['sensor_id']
+            
+            # Save to database and files
+            self.save_to_database(reading, prediction)
+            self.save_to_minio_manually(reading, prediction)
+            
+            self.stats['total_readings'] += 1
+            
+            if prediction == -1:
+                self.stats['anomalies_detected'] += 1
+                batch_anomalies += 1
+                logger.warning(f"ANOMALY: {sensor_id} - T:{reading['temperature']}C H:{reading['humidity']}%")
+            else:
+                logger.debug(f"Normal: {sensor_id} - T:{reading['temperature']}C H:{reading['humidity']}%")
+        
+        # One round-trip per table and one commit for the whole batch,
+        # one append per local file
+        self.flush_to_database()
+        self.flush_files(batch_now)
+        
+        print(f"\nBatch {batch_count}: {len(self.sensors)} readings, {batch_anomalies} anomalies (details: logs/simple_pipeline.log)")
+        logger.info(f"Batch {batch_count}: {len(self.sensors)} readings, {batch_anomalies} anomalies")
+        self.print_status()
+    
     def run_pipeline(self):
         print("Starting IoT Pipeline...")
         print("Grafana Dashboard: http://localhost:3000 (admin/admin)")
@@ -214,46 +440,46 @@ class SimpleWorkingPipeline:
         print("Data will appear in PostgreSQL for Grafana visualization")
         print("Local files will be created in data/ folder for manual MinIO upload")
         
-        batch_count = 0
+        # Generation, ML and IO overlap instead of running back to back
+        self._stages = {
+            name: threading.Thread(target=loop, name=name, daemon=True)
+            for name, loop in (
+                ('generator', self._generator_loop),
+                ('predictor', self._predictor_loop),
+                ('io-sink', self._sink_loop)
+            )
+        }
+        stages = list(self._stages.values())
+        log_listener.start()
+        for stage in stages:
+            stage.start()
+        # SIGTERM shuts down like Ctrl+C: the generator stops and its None
+        # drains the downstream stages
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
         
         try:
-            while True:
-                batch_count += 1
-                batch_anomalies = 0
-                
-                print(f"\nProcessing Batch {batch_count}")
-                
-                # Process all sensors
-                for sensor_id in self.sensors:
-                    reading = self.generate_sensor_reading(sensor_id)
-                    prediction = self.detector.predict([reading])[0]
-                    
-                    # Save to database and files
-                    self.save_to_database(reading, prediction)
-                    self.save_to_minio_manually(reading, prediction)
-                    
-                    self.stats['total_readings'] += 1
-                    
-                    if prediction == -1:
-                        self.stats['anomalies_detected'] += 1
-                        batch_anomalies += 1
-                        print(f"  ANOMALY: {sensor_id} - T:{reading['temperature']}C H:{reading['humidity']}%")
-                    else:
-                        print(f"  Normal:  {sensor_id} - T:{reading['temperature']}C H:{reading['humidity']}%")
-                
-                print(f"Batch {batch_count}: {len(self.sensors)} readings, {batch_anomalies} anomalies")
-                self.print_status()
-                
-                print("Waiting 10 seconds...")
-                time.sleep(10)
+            # Every stage is watched: one dying early stops the others
+            # instead of leaving them blocked on its queue
+            while any(stage.is_alive() for stage in stages):
+                for stage in stages:
+                    stage.join(QUEUE_POLL / len(stages))
+                    if not stage.is_alive() and not self._stop.is_set():
+                        print(f"\nPipeline stage '{stage.name}' exited unexpectedly, stopping")
+                        self._stop.set()
+            if self._stop.is_set():
+                print("\nPipeline stopped")
                 
         except KeyboardInterrupt:
             print("\nPipeline stopped by user")
+            self._stop.set()
+            for stage in stages:
+                stage.join()
         finally:
             if self.conn:
                 self.conn.close()
+            log_listener.stop()
             print("Pipeline shutdown complete")
 
 if __name__ == "__main__":
     pipeline = SimpleWorkingPipeline()
-    pipeline.run_pipeline()
\ No newline at end of file
+    pipeline.run_pipeline()
@@ -1,14 +1,27 @@
 import sys
 import os
-import psycopg2
+import time
+import threading
+import queue
 from datetime import datetime
-import random
+import numpy as np
 
 # Simplified IoT Pipeline without MinIO
 # Focus: Real-time analytics with PostgreSQL + Grafana
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ml-models'))
 from anomaly_detector import AnomalyDetector
+from postgres_client import pool, maintain_partitions
+
+# Seconds between generated batches
+BATCH_INTERVAL = float(os.environ.get('BATCH_INTERVAL', '8'))
+# The writer flushes once BATCH_SIZE readings are pending or the oldest has
+# waited BATCH_TIMEOUT_MS, whichever comes first
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '50'))
+BATCH_TIMEOUT_MS = int(os.environ.get('BATCH_TIMEOUT_MS', '200'))
+# Generated batches allowed to wait for the writer; a stalled writer makes
+# the sampling loop wait instead of growing memory without bound
+MAX_PENDING_BATCHES = 100
 
 class SimplifiedIoTPipeline:
     def __init__(self):
@@ -17,7 +30,12 @@ class SimplifiedIoTPipeline:
         self.detector = AnomalyDetector()
         self.load_model()
         self.sensors = ['sensor_001', 'sensor_002', 'sensor_003', 'sensor_004', 'sensor_005']
+        self.rng = np.random.default_rng()
         self.setup_database()
+        # Generated batches, handed to the writer thread (None stops it)
+        self.batch_q = queue.Queue(maxsize=MAX_PENDING_BATCHES)
+        self._stop = threading.Event()
+        self.writer = threading.Thread(target=self._writer_loop, name='pipeline-writer', daemon=True)
         
     def load_model(self):
         try:
@@ -27,29 +45,21 @@ class SimplifiedIoTPipeline:
             self.train_model()
     
     def train_model(self):
-        training_data = []
-        for i in range(1000):
-            is_anomaly = random.random() < 0.1
-            temperature = random.uniform(80, 120) if is_anomaly else random.uniform(18, 28)
-            humidity = random.uniform(0, 20) if is_anomaly else random.uniform(40, 70)
-            
-            training_data.append({
-                'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-                'timestamp': datetime.now().isoformat(),
-                'temperature': round(temperature, 2),
-                'humidity': round(humidity, 2),
-                'is_anomaly': is_anomaly
-            })
+        # (N, 2) temperature/humidity array; detector.train() takes it directly
+        rng = np.random.default_rng()
+        is_anomaly = rng.random(1000) < 0.1
+        temperature = np.where(is_anomaly, rng.uniform(80, 120, 1000), rng.uniform(18, 28, 1000))
+        humidity = np.where(is_anomaly, rng.uniform(0, 20, 1000), rng.uniform(40, 70, 1000))
+        training_data = np.column_stack((temperature, humidity)).round(2)
         
         self.detector.train(training_data)
         self.detector.save_model('ml-models/anomaly_model.pkl')
         print("✓ Model trained")
     
     def setup_database(self):
-        self.conn = psycopg2.connect(
-            host="localhost", database="iot_analytics",
-            user="postgres", password="postgres", port="5432"
-        )
+        # Held for the whole run: the writer thread is its only user and the
+        # session keeps the prepared ins_reading
+        self.conn = pool().getconn()
         self.cursor = self.conn.cursor()
         
         # Enhanced tables for complete analytics
@@ -79,57 +89,127 @@ class SimplifiedIoTPipeline:
             )
         """)
         
+        # Parsed and planned once for the session; batches only EXECUTE
+        self.cursor.execute("""
+            PREPARE ins_reading (varchar, timestamp, float, float, boolean, integer) AS
+            INSERT INTO sensor_readings 
+            (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
+            VALUES ($1, $2, $3, $4, $5, $6)
+        """)
+        
+        # DEFAULT/daily partitions and retention, if the tables are partitioned
+        maintain_partitions(self.conn)
         self.conn.commit()
+        # Batches are sent as one multi-statement query, which the server runs
+        # as a single implicit transaction - no separate COMMIT round-trip
+        self.conn.autocommit = True
         print("✓ PostgreSQL ready (replaces MinIO for this demo)")
     
+    def generate_batch(self):
+        """One reading per sensor (in self.sensors order) as column arrays:
+        an (N, 2) temperature/humidity block and the actual anomaly flags"""
+        # One vectorized draw per column, same distributions as train_model
+        n = len(self.sensors)
+        is_anomaly = self.rng.random(n) < 0.2
+        features = np.empty((n, 2))
+        features[:, 0] = np.where(is_anomaly, self.rng.uniform(80, 120, n), self.rng.uniform(18, 28, n))
+        features[:, 1] = np.where(is_anomaly, self.rng.uniform(0, 20, n), self.rng.uniform(40, 70, n))
+        return features.round(2, out=features), is_anomaly
+    
+    def _writer_loop(self):
+        """Score and store generated batches off the sampling loop"""
+        stopping = False
+        while not stopping:
+            batches = [self.batch_q.get()]
+            # Size-or-timeout trigger: a burst (or a backlog behind a slow
+            # write) goes out together, a lone batch after BATCH_TIMEOUT_MS
+            pending = len(batches[0][2]) if batches[0] else 0
+            deadline = time.monotonic() + BATCH_TIMEOUT_MS / 1000
+            while batches[-1] is not None and pending < BATCH_SIZE:
+                try:
+                    batch = self.batch_q.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batches.append(batch)
+                if batch:
+                    pending += len(batch[2])
+            if None in batches:
+                stopping = True
+                batches = batches[:batches.index(None)]
+            if not batches:
+                continue
+            
+            try:
+                self.write_batches(batches)
+            except Exception as e:
+                # One bad flush must not kill the writer for the rest of the run
+                print(f"  Writer error, {len(batches)} batch(es) dropped: {e}")
+    
+    def write_batches(self, batches):
+        """Score a group of queued batches with one predict call and store
+        them with one database round-trip"""
+        # ML prediction: every queued batch's feature block in one call
+        predictions = iter(self.detector.predict_ndarray(np.concatenate([b[2] for b in batches])).tolist())
+        rows = []
+        
+        for batch, batch_now, features, is_anomaly in batches:
+            print(f"\nBatch {batch}:")
+            # Columns straight to row tuples; no per-reading dicts
+            for sensor_id, temp, humidity, actual, prediction in zip(
+                self.sensors, features[:, 0].tolist(), features[:, 1].tolist(), is_anomaly.tolist(), predictions
+            ):
+                # Queued for the single INSERT round-trip
+                rows.append((sensor_id, batch_now, temp, humidity, actual, prediction))
+                
+                status = "ANOMALY" if prediction == -1 else "Normal"
+                print(f"  {sensor_id}: {temp}°C, {humidity}% -> {status}")
+        
+        try:
+            # Save to PostgreSQL: the EXECUTEs and their commit are one round-trip
+            mogrify = self.cursor.mogrify
+            self.cursor.execute(b'; '.join(mogrify("EXECUTE ins_reading (%s, %s, %s, %s, %s, %s)", row) for row in rows))
+            print("  ✓ Data saved to PostgreSQL")
+        except Exception as e:
+            print(f"  Database save error: {e}")
+    
     def run_simplified_pipeline(self):
         print("\n🚀 RUNNING SIMPLIFIED PIPELINE")
         print("📊 Grafana: http://localhost:3000")
         print("💾 All data in PostgreSQL (no MinIO needed)")
         
+        # Scoring and the database write overlap the wait for the next batch
+        self.writer.start()
         batch = 0
+        next_tick = time.monotonic()
         try:
-            while True:
+            while not self._stop.is_set():
+                if not self.writer.is_alive():
+                    print("\n✗ Writer thread stopped, stopping pipeline")
+                    break
                 batch += 1
-                print(f"\nBatch {batch}:")
-                
-                for sensor_id in self.sensors:
-                    # Generate reading
-                    is_anomaly = random.random() < 0.2
-                    temp = random.uniform(80, 120) if is_anomaly else random.uniform(18, 28)
-                    humidity = random.uniform(0, 20) if is_anomaly else random.uniform(40, 70)
-                    
-                    reading = {
-                        'sensor_id': sensor_id,
-                        'timestamp': datetime.now(),
-                        'temperature': round(temp, 2),
-                        'humidity': round(humidity, 2),
-                        'actual_anomaly': is_anomaly
-                    }
-                    
-                    # ML prediction
-                    prediction = self.detector.predict([reading])[0]
-                    
-                    # Save to PostgreSQL
-                    self.cursor.execute("""
-                        INSERT INTO sensor_readings 
-                        (sensor_id, timestamp, temperature, humidity, is_anomaly, ml_prediction)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (sensor_id, reading['timestamp'], temp, humidity, is_anomaly, prediction))
-                    
-                    status = "ANOMALY" if prediction == -1 else "Normal"
-                    print(f"  {sensor_id}: {temp}°C, {humidity}% -> {status}")
-                
-                self.conn.commit()
-                print("  ✓ Data saved to PostgreSQL")
+                # One timestamp for the whole batch
+                try:
+                    self.batch_q.put((batch, datetime.now()) + self.generate_batch(), timeout=BATCH_INTERVAL)
+                except queue.Full:
+                    print(f"  Writer backlog full, batch {batch} dropped")
                 
-                import time
-                time.sleep(8)
+                next_tick += BATCH_INTERVAL
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for <= 0:
+                    next_tick = time.monotonic()
+                else:
+                    self._stop.wait(sleep_for)
                 
         except KeyboardInterrupt:
+            self._stop.set()
             print("\n✓ Pipeline stopped")
         finally:
-            self.conn.close()
+            # Let the writer drain what was already generated
+            if self.writer.is_alive():
+                self.batch_q.put(None)
+                self.writer.join()
+            # Closed rather than reused: the session still holds ins_reading
+            pool().putconn(self.conn, close=True)
 
 if __name__ == "__main__":
     pipeline = SimplifiedIoTPipeline()
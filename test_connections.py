@@ -1,24 +1,24 @@
 import requests
-import boto3
-import psycopg2
+from requests.adapters import HTTPAdapter
+from minio_client import s3
+from postgres_client import connection
 import json
 from datetime import datetime
 
+# One keep-alive pool for the HTTP checks: repeated probes (and Grafana's
+# two requests) reuse connections instead of reconnecting each time
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 def test_minio():
     print("=== Testing MinIO Connection ===")
     try:
         # Test MinIO web console first
-        response = requests.get("http://localhost:9001", timeout=5)
+        response = session.get("http://localhost:9001", timeout=5)
         print(f"MinIO Web Console: {response.status_code} - Available")
         
         # Test S3 API
-        s3_client = boto3.client(
-            's3',
-            endpoint_url='http://localhost:9000',
-            aws_access_key_id='minioadmin',
-            aws_secret_access_key='minioadmin',
-            region_name='us-east-1'
-        )
+        s3_client = s3()
         
         # List buckets
         buckets = s3_client.list_buckets()
@@ -48,38 +48,31 @@ def test_minio():
 def test_postgres():
     print("\n=== Testing PostgreSQL Connection ===")
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database="iot_analytics",
-            user="postgres",
-            password="postgres",
-            port="5432"
-        )
-        cursor = conn.cursor()
-        
-        # Test query
-        cursor.execute("SELECT version();")
-        version = cursor.fetchone()
-        print(f"PostgreSQL: Connected")
-        print(f"Version: {version[0][:50]}...")
-        
-        # Test insert
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS test_table (
-                id SERIAL PRIMARY KEY,
-                message TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            INSERT INTO test_table (message) VALUES (%s)
-        """, ("Connection test successful",))
-        
-        conn.commit()
-        print("SUCCESS: Test data inserted")
+        with connection() as conn:
+            cursor = conn.cursor()
+            
+            # Test query
+            cursor.execute("SELECT version();")
+            version = cursor.fetchone()
+            print(f"PostgreSQL: Connected")
+            print(f"Version: {version[0][:50]}...")
+            
+            # Test insert
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS test_table (
+                    id SERIAL PRIMARY KEY,
+                    message TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            cursor.execute("""
+                INSERT INTO test_table (message) VALUES (%s)
+            """, ("Connection test successful",))
+            
+            conn.commit()
+            print("SUCCESS: Test data inserted")
         
-        conn.close()
         return True
         
     except Exception as e:
@@ -89,11 +82,11 @@ def test_postgres():
 def test_grafana():
     print("\n=== Testing Grafana Connection ===")
     try:
-        response = requests.get("http://localhost:3000", timeout=5)
+        response = session.get("http://localhost:3000", timeout=5)
         print(f"Grafana Web UI: {response.status_code} - Available")
         
         # Test API
-        response = requests.get("http://localhost:3000/api/health", timeout=5)
+        response = session.get("http://localhost:3000/api/health", timeout=5)
         if response.status_code == 200:
             print("Grafana API: Healthy")
         
@@ -2,11 +2,27 @@ from kafka import KafkaProducer
 import json
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def serialize(value):
+    """Kafka message value as UTF-8 JSON bytes"""
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value).encode('utf-8')
+
 def test_kafka_connection():
     try:
         producer = KafkaProducer(
             bootstrap_servers='localhost:9092',
-            value_serializer=lambda v: json.dumps(v).encode('utf-8')
+            value_serializer=serialize,
+            # Same batching/compression as the sensor simulator
+            linger_ms=100,
+            batch_size=65536,
+            compression_type='lz4',
+            acks=1
         )
         
         # Send a test message
@@ -4,33 +4,15 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'ml-models'))
 from anomaly_detector import AnomalyDetector
-from datetime import datetime, timedelta
-import random
 
 def generate_training_data(num_samples=1000):
-    """Generate synthetic training data"""
-    data = []
-    
-    for i in range(num_samples):
-        # 90% normal data, 10% anomalies
-        is_anomaly = random.random() < 0.1
-        
-        if is_anomaly:
-            temperature = random.uniform(80, 120)
-            humidity = random.uniform(0, 20)
-        else:
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(40, 70)
-        
-        data.append({
-            'sensor_id': f'sensor_{random.randint(1, 5):03d}',
-            'timestamp': datetime.now() - timedelta(minutes=random.randint(0, 1440)),
-            'temperature': round(temperature, 2),
-            'humidity': round(humidity, 2),
-            'is_anomaly': is_anomaly
-        })
-    
-    return data
+    """Generate synthetic training data as an (N, 2) temperature/humidity array"""
+    rng = np.random.default_rng()
+    # 90% normal data, 10% anomalies
+    is_anomaly = rng.random(num_samples) < 0.1
+    temperature = np.where(is_anomaly, rng.uniform(80, 120, num_samples), rng.uniform(18, 28, num_samples))
+    humidity = np.where(is_anomaly, rng.uniform(0, 20, num_samples), rng.uniform(40, 70, num_samples))
+    return np.column_stack((temperature, humidity)).round(2)
 
 def main():
     print("Generating training data...")